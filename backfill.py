@@ -0,0 +1,88 @@
+"""Load several past seasons at once, one worker process per season.
+
+    python backfill.py 2021-22 2022-23 2023-24 --workers 3
+    python backfill.py 2018-19:2018-10-15:2019-04-11 --delta
+
+Every season goes into the same tables, keyed by SEASON_YEAR, and keeps its own boxscore
+cache and handoff directory. Each worker has its own nba_api rate limit, so the total
+request rate is NBA_API_REQUESTS_PER_SECOND times the number of workers; lower one or the
+other if stats.nba.com starts refusing requests. Spotrac is scraped from this process one
+season at a time while the workers run, so its politeness limits still hold.
+"""
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import config
+from instrumentation import stage
+from seasons import parse_season, regular_season_windows, season_start_year
+
+
+def backfill_season(season, window, delta=config.DELTA_MODE):
+    """Fetch and load one season's games, player game logs and advanced box scores"""
+    from fetch_and_load_nba_reg_season_games_data import fetch_nba_data, load_to_postgres
+    from fetch_and_load_regular_season_player_data import fetch_player_data, player_load_to_postgres
+    from fetch_and_load_boxscores import load_boxscores
+
+    # workers are spawned, so dates given on the command line have to be registered again here
+    regular_season_windows[season] = window
+    config.HANDOFF_DIR = os.path.join(config.HANDOFF_DIR, season)
+
+    with stage(f'backfill_{season}'):
+        load_to_postgres(fetch_nba_data(delta, season))
+        player_load_to_postgres(fetch_player_data(delta, season))
+        load_boxscores(delta, season)
+
+    return season
+
+
+def backfill_salaries(seasons):
+    from salary_info import main as scrape_salaries, upload_to_postgresql
+
+    for season in seasons:
+        salaries = scrape_salaries(season_start_year(season))
+        if salaries is None:
+            print(f"No salaries scraped for {season}")
+            continue
+        upload_to_postgresql(salaries, "nba_salaries")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("seasons", nargs="+", help="seasons like 2023-24, or 2023-24:START:END for seasons without known dates")
+    parser.add_argument("--workers", type=int, default=config.BACKFILL_WORKERS, help="seasons loaded at the same time")
+    parser.add_argument("--delta", action="store_true", default=config.DELTA_MODE, help="skip games already loaded")
+    parser.add_argument("--skip-salaries", action="store_true", help="don't scrape Spotrac")
+    args = parser.parse_args()
+
+    seasons = [parse_season(spec) for spec in args.seasons]
+    print(f"Backfilling {len(seasons)} seasons with {min(args.workers, len(seasons))} workers")
+
+    failed = []
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as executor:
+        futures = {
+            executor.submit(backfill_season, season, regular_season_windows[season], args.delta): season
+            for season in seasons
+        }
+
+        if not args.skip_salaries:
+            backfill_salaries(seasons)
+
+        for future in as_completed(futures):
+            season = futures[future]
+            try:
+                future.result()
+                print(f"Backfilled {season}")
+            except Exception as e:
+                failed.append(season)
+                print(f"Backfill of {season} failed: {e!r}")
+
+    if failed:
+        raise SystemExit(f"Failed seasons: {', '.join(failed)}")
+    print("Data loaded to PostgreSQL!")
+
+
+if __name__ == "__main__":
+    main()
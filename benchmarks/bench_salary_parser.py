@@ -0,0 +1,105 @@
+"""Time the Spotrac salary table parser against saved team pages, without touching the network.
+
+With no saved pages, 30 synthetic pages from synthetic_season.py are timed instead.
+To time the real pages, save them once (this is the only step that scrapes):
+
+    python benchmarks/bench_salary_parser.py --save
+
+then time the parser as often as you like:
+
+    python benchmarks/bench_salary_parser.py --repeat 20 --output parser_timings.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from salary_parser import parse_team_salary_html
+from synthetic_season import generate_salary_pages
+
+
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "spotrac")
+
+
+def fixture_path(team_id):
+    return os.path.join(fixtures_dir, f"{team_id}.html")
+
+
+def save_fixtures(year):
+    from salary_info import make_session, polite_get, teams
+
+    os.makedirs(fixtures_dir, exist_ok=True)
+    session = make_session()
+    for team in teams:
+        url = f"https://www.spotrac.com/nba/{team['id']}/overview/_/year/{year}"
+        response = polite_get(session, url)
+        with open(fixture_path(team['id']), "w", encoding="utf-8") as f:
+            f.write(response.text)
+        print(f"Saved {url}")
+    session.close()
+
+
+def load_fixtures():
+    # read whatever pages are saved, so timing runs don't need the scraper's dependencies
+    pages = []
+    if not os.path.isdir(fixtures_dir):
+        return pages
+    for file_name in sorted(os.listdir(fixtures_dir)):
+        if file_name.endswith(".html"):
+            with open(os.path.join(fixtures_dir, file_name), encoding="utf-8") as f:
+                pages.append((file_name[:-len(".html")], f.read()))
+    return pages
+
+
+def run(repeat, year=2024):
+    pages, source = load_fixtures(), "fixtures"
+    if not pages:
+        source = "synthetic"
+        print(f"No fixtures in {fixtures_dir}; timing synthetic pages (run with --save for the real ones)")
+        pages = generate_salary_pages(year)
+
+    timings = {}
+    rows = 0
+    for team_id, page_html in pages:
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            df = parse_team_salary_html(page_html, team_id)
+            samples.append(time.perf_counter() - start)
+        timings[team_id] = samples
+        rows += len(df)
+
+    per_page = [statistics.median(samples) for samples in timings.values()]
+    for team_id, samples in timings.items():
+        print(f"{team_id:<25} median {statistics.median(samples) * 1000:7.2f} ms  min {min(samples) * 1000:7.2f} ms")
+    print(f"\n{len(pages)} pages, {rows} player rows, {sum(per_page) * 1000:.1f} ms per full pass (median per page summed)")
+
+    return {
+        "source": source,
+        "pages": len(pages),
+        "rows": rows,
+        "repeat": repeat,
+        "total_ms": sum(per_page) * 1000,
+        "per_page_ms": {team_id: statistics.median(samples) * 1000 for team_id, samples in timings.items()},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--save", action="store_true", help="download the team pages into the fixtures directory")
+    parser.add_argument("--year", type=int, default=2024)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="also write the timings to this JSON file")
+    args = parser.parse_args()
+
+    if args.save:
+        save_fixtures(args.year)
+    else:
+        results = run(args.repeat, args.year)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
@@ -0,0 +1,267 @@
+"""Time the pipeline stages on synthetic seasons, without nba_api or Spotrac.
+
+    python benchmarks/run_benchmarks.py --seasons 1 5 10
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<older commit>.json
+
+The in-process stages (dtype compaction, ratings, crosswalk matching, the SQLite
+boxscore cache) always run. The loaders and the features query need Postgres because
+they load with COPY; pass --database-url pointing at a scratch database to include them.
+Every pipeline table in that database is dropped and rebuilt.
+
+Results are written to benchmarks/results/<commit>.json, so two commits can be compared.
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(benchmarks_dir)
+sys.path.insert(0, repo_dir)
+
+import pandas as pd
+import config
+from synthetic_season import generate_seasons, combined_player_stats, teams
+
+results_dir = os.path.join(benchmarks_dir, "results")
+
+pipeline_tables = [
+    "nba_regular_season_games", "nba_regular_season_player_stats", "nba_advanced_player_stats",
+    "nba_advanced_team_stats", "player_values", "nba_salaries", "player_crosswalk", "player_features",
+    "schema_migrations",
+]
+
+
+def measure(name, rows, fn, repeat, setup=None):
+    """Run `fn` `repeat` times, after `setup` each time, with the stage's own printing silenced"""
+    runs = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            fn()
+            runs.append(time.perf_counter() - start)
+    seconds = statistics.median(runs)
+    print(f"  {name:<32} {rows:>9} rows  {seconds:8.3f} s  {rows / seconds:>12,.0f} rows/s")
+    return {"benchmark": name, "rows": rows, "seconds": seconds, "runs": runs}
+
+
+def split_by_game(frame):
+    return {game_id: game for game_id, game in frame.groupby('GAME_ID', sort=False)}
+
+
+def in_process_benchmarks(frames, repeat, workdir):
+    from compact_dtypes import compact_frame
+    from final_value_calc import calculate_player_stats_value
+    from player_crosswalk import match_players
+    from boxscore_cache import BoxscoreCache
+
+    logs = frames['player_game_logs']
+    results = [
+        measure("compact_player_game_logs", len(logs), lambda: compact_frame(logs, 'player_game_logs'), repeat),
+    ]
+
+    combined = compact_frame(combined_player_stats(frames), 'player_game_stats')
+    results.append(measure("calculate_player_stats_value", len(combined), lambda: calculate_player_stats_value(combined), repeat))
+
+    team_abbreviations = {team_name: abbreviation for abbreviation, team_name, _, _ in teams}
+    salaries = frames['salaries']
+    names = pd.DataFrame({
+        'spotrac_name': salaries['Player'],
+        'team_abbreviation': salaries['Team'].map(team_abbreviations),
+    })
+    players = logs[['PLAYER_ID', 'PLAYER_NAME', 'TEAM_ABBREVIATION']].drop_duplicates()
+    players.columns = ['player_id', 'player_name', 'team_abbreviation']
+    results.append(measure("crosswalk_match_players", len(names), lambda: match_players(names, players), repeat))
+
+    player_games = split_by_game(frames['advanced_player_stats'])
+    team_games = split_by_game(frames['advanced_team_stats'])
+    cache_path = os.path.join(workdir, "boxscore_cache.sqlite")
+
+    def fresh_cache():
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(cache_path + suffix):
+                os.remove(cache_path + suffix)
+
+    def write_cache():
+        with BoxscoreCache(cache_path) as cache:
+            for game_id, player_stats in player_games.items():
+                cache.put(game_id, player_stats, team_games[game_id])
+
+    def read_cache():
+        with BoxscoreCache(cache_path) as cache:
+            for game_id in player_games:
+                cache.get(game_id)
+
+    results.append(measure("boxscore_cache_write", len(player_games), write_cache, repeat, setup=fresh_cache))
+    results.append(measure("boxscore_cache_read", len(player_games), read_cache, repeat))
+
+    return results
+
+
+def drop_tables(*tables):
+    from db import get_conn
+
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(f"DROP MATERIALIZED VIEW IF EXISTS {config.PLAYER_VALUES_VIEW} CASCADE")
+    for table in tables:
+        cur.execute(f"DROP TABLE IF EXISTS {table} CASCADE")
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def truncate_tables(*tables):
+    from db import get_conn
+
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(f"TRUNCATE {', '.join(tables)}")
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def load_features_module():
+    spec = importlib.util.spec_from_file_location("features", os.path.join(repo_dir, "get_features_to compare.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def database_benchmarks(frames, repeat):
+    from compact_dtypes import compact_frame
+    from fetch_and_load_nba_reg_season_games_data import load_to_postgres
+    from fetch_and_load_regular_season_player_data import player_load_to_postgres
+    from fetch_and_load_players_metrics import advanced_player_metrics_to_postgres
+    from fetch_and_load_team_metrics import advanced_team_metrics_to_postgres
+    from final_value_calc import calculate_player_stats_value, upsert_player_values
+    from salary_info import upload_to_postgresql
+    from migrations import migrate
+    from rollups import refresh_rollups
+
+    features = load_features_module()
+    drop_tables(*pipeline_tables)
+    # the loaders' tables come from the migrations, so they are emptied between runs rather than dropped
+    with contextlib.redirect_stdout(io.StringIO()):
+        migrate()
+
+    team_games = frames['team_games']
+    logs = compact_frame(frames['player_game_logs'], 'player_game_logs')
+    advanced_players = compact_frame(frames['advanced_player_stats'], 'advanced_player_stats')
+    advanced_teams = compact_frame(frames['advanced_team_stats'], 'advanced_team_stats')
+    player_values = calculate_player_stats_value(compact_frame(combined_player_stats(frames), 'player_game_stats'))
+
+    results = [
+        measure("load_team_games", len(team_games), lambda: load_to_postgres(team_games), repeat,
+                setup=lambda: truncate_tables("nba_regular_season_games")),
+        measure("load_player_game_logs", len(logs), lambda: player_load_to_postgres(logs), repeat,
+                setup=lambda: truncate_tables("nba_regular_season_player_stats")),
+        measure("load_advanced_player_stats", len(advanced_players),
+                lambda: advanced_player_metrics_to_postgres(advanced_players), repeat,
+                setup=lambda: truncate_tables("nba_advanced_player_stats")),
+        measure("load_advanced_team_stats", len(advanced_teams),
+                lambda: advanced_team_metrics_to_postgres(advanced_teams), repeat,
+                setup=lambda: truncate_tables("nba_advanced_team_stats")),
+        measure("upsert_player_values", len(player_values),
+                lambda: upsert_player_values(player_values, replace=True), repeat),
+    ]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        upload_to_postgresql(frames['salaries'], "nba_salaries")
+
+    results.append(measure("features_with_new_crosswalk", len(frames['salaries']), features.get_data_from_postgres, repeat,
+                           setup=lambda: drop_tables("player_crosswalk")))
+    results.append(measure("features", len(frames['salaries']), features.get_data_from_postgres, repeat))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        player_features = features.get_data_from_postgres()
+    results.append(measure("write_player_features", len(player_features),
+                           lambda: features.write_player_features(player_features), repeat))
+    results.append(measure("refresh_rollups", len(player_values), refresh_rollups, repeat))
+    return results
+
+
+def current_commit():
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=repo_dir, capture_output=True, text=True).stdout.strip()
+
+    commit = git("rev-parse", "--short", "HEAD") or "unknown"
+    dirty = bool(git("status", "--porcelain", "--untracked-files=no"))
+    return commit, dirty
+
+
+def compare(results, base_path):
+    with open(base_path) as f:
+        base = json.load(f)
+    base_seconds = {(row["benchmark"], row["seasons"]): row["seconds"] for row in base["results"]}
+
+    print(f"\nCompared with {base['commit']} (ratio > 1 is slower now)")
+    for row in results:
+        key = (row["benchmark"], row["seasons"])
+        if key not in base_seconds:
+            continue
+        ratio = row["seconds"] / base_seconds[key]
+        flag = "  <-- regression" if ratio > 1.1 else ""
+        print(f"  {row['benchmark']:<32} {row['seasons']:>2} seasons  {base_seconds[key]:8.3f} s -> {row['seconds']:8.3f} s  x{ratio:.2f}{flag}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seasons", type=int, nargs="+", default=[1, 5, 10], help="season counts to scale through")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark; the median is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database-url", help="scratch Postgres database for the loader and features benchmarks")
+    parser.add_argument("--output", help="results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="nba_bench_")
+    config.HANDOFF_DIR = os.path.join(workdir, "handoff")
+    # the benchmarks keep their own timings; stage metrics would only add overhead and a file to clean up
+    config.METRICS_FILE = ""
+    if args.database_url:
+        config.DATABASE_URL = args.database_url
+
+    results = []
+    for n_seasons in args.seasons:
+        frames = generate_seasons(n_seasons, seed=args.seed)
+        print(f"\n{n_seasons} season(s): {len(frames['team_games']) // 2} games, {len(frames['player_game_logs'])} player-game rows")
+
+        season_results = in_process_benchmarks(frames, args.repeat, workdir)
+        if args.database_url:
+            season_results += database_benchmarks(frames, args.repeat)
+        for row in season_results:
+            row["seasons"] = n_seasons
+        results += season_results
+
+    commit, dirty = current_commit()
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "database": bool(args.database_url),
+        "repeat": args.repeat,
+        "results": results,
+    }
+
+    output = args.output or os.path.join(results_dir, f"{commit}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved results to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
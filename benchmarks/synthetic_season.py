@@ -0,0 +1,379 @@
+"""Synthetic NBA seasons in the shapes the pipeline ingests, so stages can be timed offline.
+
+One season is 1230 games (82 rounds of 15), about 26k player-game rows, the two
+BoxScoreAdvancedV2 frames and one Spotrac salary table, all generated from a seed.
+The salary table can also be rendered as the 30 Spotrac team overview pages.
+"""
+import datetime
+import html
+import numpy as np
+import pandas as pd
+
+
+teams = [
+    ("ATL", "Atlanta Hawks", "Atlanta", "Hawks"), ("BOS", "Boston Celtics", "Boston", "Celtics"),
+    ("BKN", "Brooklyn Nets", "Brooklyn", "Nets"), ("CHA", "Charlotte Hornets", "Charlotte", "Hornets"),
+    ("CHI", "Chicago Bulls", "Chicago", "Bulls"), ("CLE", "Cleveland Cavaliers", "Cleveland", "Cavaliers"),
+    ("DAL", "Dallas Mavericks", "Dallas", "Mavericks"), ("DEN", "Denver Nuggets", "Denver", "Nuggets"),
+    ("DET", "Detroit Pistons", "Detroit", "Pistons"), ("GSW", "Golden State Warriors", "Golden State", "Warriors"),
+    ("HOU", "Houston Rockets", "Houston", "Rockets"), ("IND", "Indiana Pacers", "Indiana", "Pacers"),
+    ("LAC", "LA Clippers", "LA", "Clippers"), ("LAL", "Los Angeles Lakers", "Los Angeles", "Lakers"),
+    ("MEM", "Memphis Grizzlies", "Memphis", "Grizzlies"), ("MIA", "Miami Heat", "Miami", "Heat"),
+    ("MIL", "Milwaukee Bucks", "Milwaukee", "Bucks"), ("MIN", "Minnesota Timberwolves", "Minnesota", "Timberwolves"),
+    ("NOP", "New Orleans Pelicans", "New Orleans", "Pelicans"), ("NYK", "New York Knicks", "New York", "Knicks"),
+    ("OKC", "Oklahoma City Thunder", "Oklahoma City", "Thunder"), ("ORL", "Orlando Magic", "Orlando", "Magic"),
+    ("PHI", "Philadelphia 76ers", "Philadelphia", "76ers"), ("PHX", "Phoenix Suns", "Phoenix", "Suns"),
+    ("POR", "Portland Trail Blazers", "Portland", "Trail Blazers"), ("SAC", "Sacramento Kings", "Sacramento", "Kings"),
+    ("SAS", "San Antonio Spurs", "San Antonio", "Spurs"), ("TOR", "Toronto Raptors", "Toronto", "Raptors"),
+    ("UTA", "Utah Jazz", "Utah", "Jazz"), ("WAS", "Washington Wizards", "Washington", "Wizards"),
+]
+
+first_names = [
+    "James", "Jalen", "Anthony", "Marcus", "Tyrese", "Jaylen", "Kevin", "Chris", "Josh", "Derrick",
+    "Luka", "Nikola", "Jamal", "Donovan", "Devin", "Zion", "Trae", "Darius", "Kyle", "Mikal",
+    "Scottie", "Evan", "Franz", "Paolo", "Cade", "Jaren", "Desmond", "Bam", "Tyler", "Jimmy",
+    "Brandon", "Lauri", "Walker", "Keegan", "De'Aaron", "Domantas", "Victor", "Jakob", "Immanuel", "Deni",
+]
+last_names = [
+    "Williams", "Johnson", "Brown", "Jones", "Davis", "Miller", "Wilson", "Moore", "Taylor", "Anderson",
+    "Thomas", "Jackson", "White", "Harris", "Martin", "Thompson", "Garcia", "Martinez", "Robinson", "Clark",
+    "Rodriguez", "Lewis", "Lee", "Walker", "Hall", "Allen", "Young", "Hernandez", "King", "Wright",
+    "Lopez", "Hill", "Scott", "Green", "Adams", "Baker", "Gonzalez", "Nelson", "Carter", "Mitchell",
+    "Perez", "Roberts", "Turner", "Phillips", "Campbell", "Parker", "Evans", "Edwards", "Collins", "Stewart",
+]
+
+roster_size = 15
+rounds = 82
+first_team_id = 1610612737
+first_player_id = 1630000
+positions = ["PG", "SG", "SF", "PF", "C"]
+start_positions = ["F", "F", "C", "G", "G"]
+
+
+def player_names(seed=0):
+    """Stable names for every roster slot in the league, so player ids keep their name across seasons"""
+    rng = np.random.default_rng(seed)
+    slots = rng.permutation(len(first_names) * len(last_names))[:len(teams) * roster_size]
+    return [f"{first_names[slot % len(first_names)]} {last_names[slot // len(first_names)]}" for slot in slots]
+
+
+def generate_season(start_year=2024, seed=0):
+    """Frames for one regular season, keyed like the stages that produce them:
+
+    team_games (LeagueGameFinder), player_game_logs (PlayerGameLogs, trimmed to the loaded columns),
+    advanced_player_stats and advanced_team_stats (BoxScoreAdvancedV2), salaries (salary_info.main).
+    """
+    rng = np.random.default_rng([seed, start_year])
+    names = player_names(seed)
+    season_year = f"{start_year}-{(start_year + 1) % 100:02d}"
+
+    # each round pairs all 30 teams, so every team plays exactly 82 games
+    home, away = [], []
+    for _ in range(rounds):
+        order = rng.permutation(len(teams))
+        home.append(order[:15])
+        away.append(order[15:])
+    home, away = np.concatenate(home), np.concatenate(away)
+    n_games = len(home)
+
+    game_ids = np.array([f"002{start_year % 100:02d}{i:05d}" for i in range(1, n_games + 1)])
+    season_days = (datetime.date(start_year + 1, 4, 13) - datetime.date(start_year, 10, 22)).days
+    game_dates = np.datetime64(f"{start_year}-10-22") + (np.arange(n_games) * season_days // n_games).astype('timedelta64[D]')
+    home_wins = rng.random(n_games) < 0.55
+
+    # one row per team per game
+    tg_game = np.repeat(np.arange(n_games), 2)
+    tg_team = np.column_stack([home, away]).ravel()
+    tg_opponent = np.column_stack([away, home]).ravel()
+    tg_home = np.tile([True, False], n_games)
+    tg_win = np.where(tg_home, home_wins[tg_game], ~home_wins[tg_game])
+
+    # 9 to 12 players per team per game, the first five are starters
+    players_per_team_game = rng.integers(9, 13, size=len(tg_game))
+    row_team_game = np.repeat(np.arange(len(tg_game)), players_per_team_game)
+    slot = np.concatenate([rng.permutation(roster_size)[:k] for k in players_per_team_game])
+    starter = np.concatenate([np.arange(k) < 5 for k in players_per_team_game])
+    n_rows = len(row_team_game)
+
+    team_index = tg_team[row_team_game]
+    opponent_index = tg_opponent[row_team_game]
+    game_index = tg_game[row_team_game]
+    player_index = team_index * roster_size + slot
+    is_home = tg_home[row_team_game]
+    win = tg_win[row_team_game]
+
+    seconds = np.where(starter, rng.integers(24 * 60, 42 * 60, n_rows), rng.integers(2 * 60, 26 * 60, n_rows))
+    minutes = seconds / 60
+
+    fga = rng.poisson(minutes * 0.36)
+    fgm = rng.binomial(fga, 0.47)
+    fg3a = rng.binomial(fga, 0.38)
+    fg3m = np.minimum(rng.binomial(fg3a, 0.36), fgm)
+    fta = rng.poisson(minutes * 0.1)
+    ftm = rng.binomial(fta, 0.78)
+    oreb = rng.poisson(minutes * 0.03)
+    dreb = rng.poisson(minutes * 0.11)
+    ast = rng.poisson(minutes * 0.08)
+    stl = rng.poisson(minutes * 0.025)
+    blk = rng.poisson(minutes * 0.015)
+    tov = rng.poisson(minutes * 0.04)
+    pf = np.minimum(rng.poisson(minutes * 0.06), 6)
+    pts = 2 * (fgm - fg3m) + 3 * fg3m + ftm
+    reb = oreb + dreb
+    double_digits = (pts >= 10).astype(int) + (reb >= 10) + (ast >= 10) + (stl >= 10) + (blk >= 10)
+
+    def pct(made, attempted):
+        return np.round(np.divide(made, attempted, out=np.zeros(len(made)), where=attempted > 0), 3)
+
+    team_abbreviations = np.array([team[0] for team in teams])
+    team_names = np.array([team[1] for team in teams])
+    team_cities = np.array([team[2] for team in teams])
+    team_nicknames = np.array([team[3] for team in teams])
+    player_names_array = np.array(names)
+    team_ids = first_team_id + np.arange(len(teams))
+    player_ids = first_player_id + player_index
+
+    matchups = np.where(
+        is_home,
+        np.char.add(np.char.add(team_abbreviations[team_index], " vs. "), team_abbreviations[opponent_index]),
+        np.char.add(np.char.add(team_abbreviations[team_index], " @ "), team_abbreviations[opponent_index]),
+    )
+    wl = np.where(win, "W", "L")
+    plus_minus = rng.integers(-18, 12, n_rows) + np.where(win, 8, 0)
+    min_sec = [f"{s // 60}:{s % 60:02d}" for s in seconds]
+
+    player_game_logs = pd.DataFrame({
+        'SEASON_YEAR': season_year,
+        'PLAYER_ID': player_ids,
+        'PLAYER_NAME': player_names_array[player_index],
+        'NICKNAME': [name.split(' ')[0] for name in player_names_array[player_index]],
+        'TEAM_ID': team_ids[team_index],
+        'TEAM_ABBREVIATION': team_abbreviations[team_index],
+        'TEAM_NAME': team_names[team_index],
+        'GAME_ID': game_ids[game_index],
+        'GAME_DATE': np.datetime_as_string(game_dates[game_index]) + 'T00:00:00',
+        'MATCHUP': matchups,
+        'WL': wl,
+        'MIN': np.round(minutes, 6),
+        'FGM': fgm, 'FGA': fga, 'FG_PCT': pct(fgm, fga),
+        'FG3M': fg3m, 'FG3A': fg3a, 'FG3_PCT': pct(fg3m, fg3a),
+        'FTM': ftm, 'FTA': fta, 'FT_PCT': pct(ftm, fta),
+        'OREB': oreb, 'DREB': dreb, 'REB': reb, 'AST': ast, 'TOV': tov, 'STL': stl, 'BLK': blk,
+        'BLKA': rng.poisson(minutes * 0.015), 'PF': pf, 'PFD': rng.poisson(minutes * 0.06), 'PTS': pts,
+        'PLUS_MINUS': plus_minus.astype(float),
+        'NBA_FANTASY_PTS': np.round(pts + 1.2 * reb + 1.5 * ast + 3 * stl + 3 * blk - tov, 1),
+        'DD2': (double_digits >= 2).astype(int),
+        'TD3': (double_digits >= 3).astype(int),
+        'MIN_SEC': min_sec,
+    })
+
+    def rating(mean, spread, size):
+        return np.round(rng.normal(mean, spread, size), 1)
+
+    advanced_player_stats = pd.DataFrame({
+        'GAME_ID': game_ids[game_index],
+        'TEAM_ID': team_ids[team_index],
+        'TEAM_ABBREVIATION': team_abbreviations[team_index],
+        'TEAM_CITY': team_cities[team_index],
+        'PLAYER_ID': player_ids,
+        'PLAYER_NAME': player_names_array[player_index],
+        'NICKNAME': player_game_logs['NICKNAME'],
+        'START_POSITION': np.where(starter, np.array(start_positions)[slot % 5], ''),
+        'COMMENT': '',
+        'MIN': [f"{s // 60}.000000:{s % 60:02d}" for s in seconds],
+        'E_OFF_RATING': rating(112, 18, n_rows), 'OFF_RATING': rating(112, 18, n_rows),
+        'E_DEF_RATING': rating(112, 14, n_rows), 'DEF_RATING': rating(112, 14, n_rows),
+        'E_NET_RATING': rating(0, 20, n_rows), 'NET_RATING': rating(0, 20, n_rows),
+        'AST_PCT': np.round(rng.beta(2, 10, n_rows), 3), 'AST_TOV': rating(1.8, 1.2, n_rows),
+        'AST_RATIO': rating(15, 8, n_rows),
+        'OREB_PCT': np.round(rng.beta(2, 25, n_rows), 3), 'DREB_PCT': np.round(rng.beta(3, 15, n_rows), 3),
+        'REB_PCT': np.round(rng.beta(3, 20, n_rows), 3), 'TM_TOV_PCT': rating(12, 6, n_rows),
+        'EFG_PCT': np.round(rng.beta(6, 6, n_rows), 3), 'TS_PCT': np.round(rng.beta(7, 6, n_rows), 3),
+        'USG_PCT': np.round(rng.beta(4, 16, n_rows), 3), 'E_USG_PCT': np.round(rng.beta(4, 16, n_rows), 3),
+        'E_PACE': rating(99, 4, n_rows), 'PACE': rating(99, 4, n_rows), 'PACE_PER40': rating(82, 3, n_rows),
+        'POSS': np.round(minutes * 2.05).astype(int), 'PIE': np.round(rng.normal(0.1, 0.08, n_rows), 3),
+        'SEASON_YEAR': season_year,
+    })
+
+    n_team_games = len(tg_game)
+    advanced_team_stats = pd.DataFrame({
+        'GAME_ID': game_ids[tg_game],
+        'TEAM_ID': team_ids[tg_team],
+        'TEAM_NAME': team_nicknames[tg_team],
+        'TEAM_ABBREVIATION': team_abbreviations[tg_team],
+        'TEAM_CITY': team_cities[tg_team],
+        'MIN': '240.000000:00',
+        'E_OFF_RATING': rating(112, 9, n_team_games), 'OFF_RATING': rating(112, 9, n_team_games),
+        'E_DEF_RATING': rating(112, 9, n_team_games), 'DEF_RATING': rating(112, 9, n_team_games),
+        'E_NET_RATING': rating(0, 12, n_team_games), 'NET_RATING': rating(0, 12, n_team_games),
+        'AST_PCT': np.round(rng.beta(12, 8, n_team_games), 3), 'AST_TOV': rating(1.9, 0.5, n_team_games),
+        'AST_RATIO': rating(18, 3, n_team_games),
+        'OREB_PCT': np.round(rng.beta(5, 15, n_team_games), 3), 'DREB_PCT': np.round(rng.beta(15, 5, n_team_games), 3),
+        'REB_PCT': np.round(rng.beta(10, 10, n_team_games), 3),
+        'E_TM_TOV_PCT': rating(12, 3, n_team_games), 'TM_TOV_PCT': rating(12, 3, n_team_games),
+        'EFG_PCT': np.round(rng.beta(11, 10, n_team_games), 3), 'TS_PCT': np.round(rng.beta(12, 10, n_team_games), 3),
+        'USG_PCT': 1.0, 'E_USG_PCT': 1.0,
+        'E_PACE': rating(99, 4, n_team_games), 'PACE': rating(99, 4, n_team_games),
+        'PACE_PER40': rating(82, 3, n_team_games), 'POSS': rng.integers(90, 110, n_team_games),
+        'PIE': np.round(rng.normal(0.5, 0.08, n_team_games), 3),
+        'SEASON_YEAR': season_year,
+    })
+
+    # LeagueGameFinder rows are the box score totals of each team's game
+    totals_columns = ['FGM', 'FGA', 'FG3M', 'FG3A', 'FTM', 'FTA', 'OREB', 'DREB', 'REB', 'AST', 'STL', 'BLK', 'TOV', 'PF', 'PTS']
+    totals = player_game_logs.groupby(row_team_game, sort=True)[totals_columns].sum()
+    opponent_pts = totals['PTS'].to_numpy().reshape(-1, 2)[:, ::-1].ravel()
+    team_games = pd.DataFrame({
+        'SEASON_ID': f"2{start_year}",
+        'TEAM_ID': team_ids[tg_team],
+        'TEAM_ABBREVIATION': team_abbreviations[tg_team],
+        'TEAM_NAME': team_names[tg_team],
+        'GAME_ID': game_ids[tg_game],
+        'GAME_DATE': np.datetime_as_string(game_dates[tg_game]),
+        'MATCHUP': np.where(
+            tg_home,
+            np.char.add(np.char.add(team_abbreviations[tg_team], " vs. "), team_abbreviations[tg_opponent]),
+            np.char.add(np.char.add(team_abbreviations[tg_team], " @ "), team_abbreviations[tg_opponent]),
+        ),
+        'WL': np.where(tg_win, "W", "L"),
+        'MIN': 240,
+    })
+    team_games = pd.concat([team_games, totals.reset_index(drop=True)], axis=1)
+    team_games['FG_PCT'] = pct(team_games['FGM'].to_numpy(), team_games['FGA'].to_numpy())
+    team_games['FG3_PCT'] = pct(team_games['FG3M'].to_numpy(), team_games['FG3A'].to_numpy())
+    team_games['FT_PCT'] = pct(team_games['FTM'].to_numpy(), team_games['FTA'].to_numpy())
+    team_games['PLUS_MINUS'] = (team_games['PTS'] - opponent_pts).astype(float)
+    team_games['SEASON_YEAR'] = season_year
+
+    salaries = generate_salaries(start_year, seed)
+
+    return {
+        'team_games': team_games,
+        'player_game_logs': player_game_logs,
+        'advanced_player_stats': advanced_player_stats,
+        'advanced_team_stats': advanced_team_stats,
+        'salaries': salaries,
+    }
+
+
+def generate_salaries(start_year=2024, seed=0):
+    """One salary row per rostered player, as salary_info.main hands off; a few names are spelled the way Spotrac differs"""
+    rng = np.random.default_rng([seed, start_year, 1])
+    names = player_names(seed)
+    n_players = len(names)
+
+    spotrac_names = []
+    for name in names:
+        roll = rng.random()
+        if roll < 0.05:
+            name = f"{name} Jr."
+        elif roll < 0.08:
+            first, last = name.split(' ', 1)
+            name = f"{first[:-1]} {last}"
+        spotrac_names.append(name)
+
+    cap_hit = (rng.lognormal(15.8, 0.9, n_players)).astype(int)
+    cap = 140_588_000
+    return pd.DataFrame({
+        'Team': [teams[i // roster_size][1] for i in range(n_players)],
+        'Player': spotrac_names,
+        'Pos': rng.choice(positions, n_players),
+        'Age': rng.integers(19, 38, n_players),
+        'Cap Hit': cap_hit,
+        'Cap Hit Pct League Cap': np.round(cap_hit / cap * 100, 2),
+        'Apron Salary': cap_hit,
+        'Luxury Tax': 0,
+        'Cash Total': cap_hit,
+        'Cash Guaranteed': (cap_hit * rng.uniform(0.5, 1, n_players)).astype(int),
+        'Free Agent Year': start_year + rng.integers(1, 5, n_players),
+        'season_year': f"{start_year}-{(start_year + 1) % 100:02d}",
+    })
+
+
+salary_page_columns = [
+    'Player', 'Pos', 'Age', 'Cap Hit', 'Cap Hit Pct League Cap', 'Apron Salary', 'Luxury Tax',
+    'Cash Total', 'Cash Guaranteed', 'Free Agent Year',
+]
+
+
+def salary_page_html(team_salaries):
+    """One team's rows as a Spotrac overview page: a cap summary table ahead of the roster table,
+    the player cell holding the short and the full name, and amounts written as $1,234,567 and 1.23%"""
+    def cell(column, value):
+        if column == 'Player':
+            first, last = value.split(' ', 1)
+            return f'<a href="#">{html.escape(first[0])}. {html.escape(last)}</a>\n<span>{html.escape(value)}</span>'
+        if column == 'Cap Hit Pct League Cap':
+            return f"{value:.2f}%"
+        if column in ('Cap Hit', 'Apron Salary', 'Luxury Tax', 'Cash Total', 'Cash Guaranteed'):
+            return f"${value:,}"
+        return html.escape(str(value))
+
+    headers = "".join(
+        f"<th>{column} ({len(team_salaries)})</th>" if column == 'Player' else f"<th>{column}</th>"
+        for column in salary_page_columns
+    )
+    rows = "\n".join(
+        "<tr>" + "".join(f"<td>{cell(column, row[column])}</td>" for column in salary_page_columns) + "</tr>"
+        for _, row in team_salaries.iterrows()
+    )
+    cap_total = int(team_salaries['Cap Hit'].sum())
+    return f"""<html><head><title>{html.escape(team_salaries['Team'].iloc[0])} Salary Cap</title></head><body>
+<nav><ul><li><a href="#">NBA</a></li><li><a href="#">Teams</a></li></ul></nav>
+<table><thead><tr><th></th><th>Total</th></tr></thead>
+<tbody><tr><td>Cap Allocations</td><td>${cap_total:,}</td></tr></tbody></table>
+<table><thead><tr>{headers}</tr></thead>
+<tbody>
+{rows}
+</tbody></table>
+</body></html>"""
+
+
+def generate_salary_pages(start_year=2024, seed=0):
+    """(team_id, page_html) for all 30 teams, team_id being the Spotrac URL slug"""
+    salaries = generate_salaries(start_year, seed)
+    return [
+        (team_name.lower().replace(' ', '-'), salary_page_html(team_salaries))
+        for team_name, team_salaries in salaries.groupby('Team', sort=True)
+    ]
+
+
+def generate_seasons(n_seasons=1, last_year=2024, seed=0):
+    """`n_seasons` consecutive seasons ending with `last_year`, concatenated; salaries are the last season's"""
+    seasons = [generate_season(year, seed) for year in range(last_year - n_seasons + 1, last_year + 1)]
+    frames = {
+        name: pd.concat([season[name] for season in seasons], ignore_index=True)
+        for name in seasons[0] if name != 'salaries'
+    }
+    frames['salaries'] = seasons[-1]['salaries']
+    return frames
+
+
+def combined_player_stats(frames):
+    """The merged frame PipelineDataContext.combined_player_stats reads back from Postgres"""
+    logs = frames['player_game_logs']
+    player_boxscore = pd.DataFrame({
+        column.lower(): logs[column] for column in [
+            'SEASON_YEAR', 'PLAYER_ID', 'PLAYER_NAME', 'TEAM_ID', 'TEAM_ABBREVIATION', 'TEAM_NAME', 'GAME_ID',
+            'MATCHUP', 'WL', 'MIN', 'FGM', 'FGA', 'FG_PCT', 'FG3M', 'FG3A', 'FG3_PCT', 'FTM', 'FTA', 'FT_PCT',
+            'OREB', 'DREB', 'REB', 'AST', 'TOV', 'STL', 'BLK', 'PF', 'PTS', 'PLUS_MINUS',
+        ]
+    })
+    player_boxscore['game_date'] = pd.to_datetime(logs['GAME_DATE']).dt.date
+
+    advanced = frames['advanced_player_stats']
+    advanced_player_stats = pd.DataFrame({
+        column.lower(): advanced[column] for column in [
+            'GAME_ID', 'PLAYER_ID', 'PLAYER_NAME', 'TEAM_ID', 'TEAM_ABBREVIATION', 'OFF_RATING', 'DEF_RATING',
+            'NET_RATING', 'AST_PCT', 'AST_RATIO', 'OREB_PCT', 'DREB_PCT', 'REB_PCT', 'EFG_PCT', 'TS_PCT',
+            'USG_PCT', 'PIE',
+        ]
+    })
+    advanced_player_stats['min'] = advanced['MIN'].str.split('.').str[0].astype(float)
+
+    return pd.merge(
+        player_boxscore,
+        advanced_player_stats,
+        on=['game_id', 'player_id', 'player_name', 'team_id', 'team_abbreviation'],
+        suffixes=('', '_adv')
+    )
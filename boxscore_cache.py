@@ -0,0 +1,94 @@
+import os
+import pickle
+import sqlite3
+import time
+
+
+default_cache_file = os.path.join(os.path.dirname(__file__), "boxscore_cache.sqlite")
+
+
+class BoxscoreCache:
+    """Append-only per-game store for the advanced boxscore frames, backed by SQLite.
+
+    Every fetched game is committed as soon as it is stored, so an interrupted run
+    resumes from the last game it saved. Lookups go through the GAME_ID index and
+    load one game at a time. Writing a game again appends a new row that shadows the
+    old one; compact() drops the shadowed rows.
+    """
+
+    def __init__(self, path=default_cache_file):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS boxscores (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                game_id TEXT NOT NULL,
+                player_stats BLOB NOT NULL,
+                team_stats BLOB NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS boxscores_game_id ON boxscores (game_id, id)")
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __contains__(self, game_id):
+        row = self.conn.execute("SELECT 1 FROM boxscores WHERE game_id = ? LIMIT 1", (game_id,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(DISTINCT game_id) FROM boxscores").fetchone()[0]
+
+    def game_ids(self):
+        return {row[0] for row in self.conn.execute("SELECT DISTINCT game_id FROM boxscores")}
+
+    def get(self, game_id):
+        row = self.conn.execute("""
+            SELECT player_stats, team_stats FROM boxscores
+            WHERE game_id = ? ORDER BY id DESC LIMIT 1
+        """, (game_id,)).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(row[0]), pickle.loads(row[1])
+
+    def put(self, game_id, player_stats, team_stats):
+        self.conn.execute(
+            "INSERT INTO boxscores (game_id, player_stats, team_stats, fetched_at) VALUES (?, ?, ?, ?)",
+            (game_id, pickle.dumps(player_stats), pickle.dumps(team_stats), time.time())
+        )
+        self.conn.commit()
+
+    def import_pickle(self, cached_data):
+        """Copy a {game_id: (player_stats, team_stats)} dict from the old pickle caches into the store"""
+        known_game_ids = self.game_ids()
+        rows = [
+            (game_id, pickle.dumps(player_stats), pickle.dumps(team_stats), time.time())
+            for game_id, (player_stats, team_stats) in cached_data.items()
+            if game_id not in known_game_ids
+        ]
+        self.conn.executemany(
+            "INSERT INTO boxscores (game_id, player_stats, team_stats, fetched_at) VALUES (?, ?, ?, ?)", rows
+        )
+        self.conn.commit()
+        return len(rows)
+
+    def compact(self):
+        """Drop rows shadowed by a newer write of the same game and reclaim the space"""
+        deleted = self.conn.execute("""
+            DELETE FROM boxscores
+            WHERE id NOT IN (SELECT MAX(id) FROM boxscores GROUP BY game_id)
+        """).rowcount
+        self.conn.commit()
+        if deleted:
+            self.conn.execute("VACUUM")
+        return deleted
+
+    def close(self):
+        self.conn.close()
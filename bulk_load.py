@@ -0,0 +1,48 @@
+import io
+
+
+def _copy_frame(cur, frame, table, column_list):
+    # convert_dtypes turns integral float columns (ints with gaps) back into ints so COPY accepts them for INT columns
+    buffer = io.StringIO()
+    frame.convert_dtypes().to_csv(buffer, index=False, header=False, na_rep=r'\N')
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+
+
+def copy_upsert(cur, frame, table, columns, conflict_columns, update_columns):
+    """Upsert `frame` into `table` with one COPY into a temp staging table and one set-based merge.
+
+    The frame's `columns` are streamed with COPY FROM STDIN into a temp copy of `table` that
+    is dropped on commit, then merged with a single INSERT ... SELECT ... ON CONFLICT.
+    When a key appears more than once in the frame the last row wins, like the old
+    row-by-row executemany.
+    """
+    staging_table = f"{table}_staging"
+    column_list = ", ".join(columns)
+    conflict_list = ", ".join(conflict_columns)
+    updates = ",\n            ".join(f"{column} = EXCLUDED.{column}" for column in update_columns)
+
+    frame = frame[list(columns)].drop_duplicates(subset=list(conflict_columns), keep='last')
+
+    # ON COMMIT DROP only fires at commit, so an earlier upsert into the same table within this
+    # transaction leaves its staging table behind
+    cur.execute(f"DROP TABLE IF EXISTS pg_temp.{staging_table}")
+    cur.execute(f"CREATE TEMP TABLE {staging_table} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+    _copy_frame(cur, frame, staging_table, column_list)
+    cur.execute(f"""
+        INSERT INTO {table} ({column_list})
+        SELECT {column_list} FROM {staging_table}
+        ON CONFLICT ({conflict_list}) DO UPDATE SET
+            {updates}
+    """)
+
+    return len(frame)
+
+
+def copy_rows(cur, frame, table, columns):
+    """Append `frame`'s `columns` to `table` with a single COPY, for tables that are rewritten rather than merged.
+
+    Column names are quoted, so they have to match the table's exactly, case included.
+    """
+    _copy_frame(cur, frame[list(columns)], table, ", ".join(f'"{column}"' for column in columns))
+    return len(frame)
@@ -0,0 +1,70 @@
+import pandas as pd
+import config
+
+
+# Per-frame schema: which string columns become categoricals and which column holds "MM:SS" minutes
+schemas = {
+    'player_game_logs': {
+        'categories': ['SEASON_YEAR', 'PLAYER_NAME', 'NICKNAME', 'TEAM_ABBREVIATION', 'TEAM_NAME',
+                       'MATCHUP', 'WL', 'MIN_SEC'],
+        'minutes': 'MIN_SEC',
+    },
+    'advanced_player_stats': {
+        'categories': ['SEASON_YEAR', 'TEAM_ABBREVIATION', 'TEAM_CITY', 'PLAYER_NAME', 'NICKNAME', 'START_POSITION', 'COMMENT'],
+        'minutes': 'MIN',
+    },
+    'advanced_team_stats': {
+        'categories': ['SEASON_YEAR', 'TEAM_NAME', 'TEAM_ABBREVIATION', 'TEAM_CITY'],
+        'minutes': 'MIN',
+    },
+    'player_game_stats': {
+        'categories': ['season_year', 'player_name', 'team_abbreviation', 'team_name', 'matchup', 'wl'],
+    },
+}
+
+
+def minutes_to_seconds(minutes):
+    """Parse "MM:SS" minutes (nba_api sometimes sends "MM.000000:SS") into integer seconds"""
+    parts = minutes.astype('string').str.split(':', n=1, expand=True).reindex(columns=[0, 1])
+    whole_minutes = pd.to_numeric(parts[0], errors='coerce').floordiv(1)
+    seconds = pd.to_numeric(parts[1], errors='coerce').fillna(0)
+    return (whole_minutes * 60 + seconds).astype('Int32')
+
+
+def whole_minutes(frame):
+    """Whole minutes played, as the MIN column of the advanced stats tables stores them"""
+    if 'MIN_SECONDS' in frame.columns:
+        return (frame['MIN_SECONDS'] // 60).astype(float)
+    return frame['MIN'].str.split(':').str[0].astype(float)
+
+
+def compact_frame(frame, schema_name):
+    """Apply a schema from `schemas` to a freshly ingested frame: categoricals, downcast ints and MIN_SECONDS"""
+    if not config.COMPACT_DTYPES or frame.empty:
+        return frame
+
+    schema = schemas[schema_name]
+    frame = frame.copy()
+
+    minutes_column = schema.get('minutes')
+    if minutes_column in frame.columns and 'MIN_SECONDS' not in frame.columns:
+        frame['MIN_SECONDS'] = minutes_to_seconds(frame[minutes_column])
+
+    for column in frame.columns:
+        if column in schema['categories']:
+            frame[column] = frame[column].astype('category')
+        elif pd.api.types.is_integer_dtype(frame[column].dtype):
+            # floats stay float64 so ratings and loaded values don't lose precision
+            frame[column] = pd.to_numeric(frame[column], downcast='integer')
+
+    return frame
+
+
+def check_memory_budget(frame, stage):
+    """Report a frame's memory use and flag it when it is over MEMORY_BUDGET_MB"""
+    used_mb = frame.memory_usage(deep=True).sum() / 1024 ** 2
+    if config.MEMORY_BUDGET_MB and used_mb > config.MEMORY_BUDGET_MB:
+        print(f"WARNING: {stage} holds {used_mb:.1f} MB, over the {config.MEMORY_BUDGET_MB:.0f} MB memory budget")
+    else:
+        print(f"{stage} holds {used_mb:.1f} MB")
+    return used_mb
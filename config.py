@@ -0,0 +1,64 @@
+import os
+
+
+# nba_api request budget shared by the boxscore fetchers
+NBA_API_REQUESTS_PER_SECOND = float(os.getenv("NBA_API_REQUESTS_PER_SECOND", "1.5"))
+NBA_API_BURST = int(os.getenv("NBA_API_BURST", "2"))
+NBA_API_WORKERS = int(os.getenv("NBA_API_WORKERS", "4"))
+NBA_API_TIMEOUT = float(os.getenv("NBA_API_TIMEOUT", "30"))
+NBA_API_RETRIES = int(os.getenv("NBA_API_RETRIES", "3"))
+NBA_API_BACKOFF = float(os.getenv("NBA_API_BACKOFF", "2.0"))
+
+# Season the fetchers load when no season is passed in; backfill.py runs several in parallel
+SEASON = os.getenv("NBA_SEASON", "2024-25")
+BACKFILL_WORKERS = int(os.getenv("NBA_BACKFILL_WORKERS", "5"))
+
+# LeagueGameFinder season schedule, cached on disk and shared by every stage; refetched once older than the TTL (seconds)
+SCHEDULE_CACHE_DIR = os.getenv("NBA_SCHEDULE_CACHE_DIR", os.path.join(os.path.dirname(__file__), "schedule_cache"))
+SCHEDULE_CACHE_TTL = float(os.getenv("NBA_SCHEDULE_CACHE_TTL", "21600"))
+# delta runs load the schedule rows themselves (scores, box-score totals), so they only reuse a schedule this fresh
+SCHEDULE_DELTA_TTL = float(os.getenv("NBA_SCHEDULE_DELTA_TTL", "300"))
+
+# Games per DataFrame chunk streamed from the boxscore fetch into the loaders
+BOXSCORE_CHUNK_SIZE = int(os.getenv("BOXSCORE_CHUNK_SIZE", "100"))
+
+# "full" reloads the whole season, "delta" only fetches and loads games newer than what Postgres already holds
+PIPELINE_MODE = os.getenv("NBA_PIPELINE_MODE", "full")
+DELTA_MODE = PIPELINE_MODE == "delta"
+
+# "python" rates games in pandas and uploads player_values, "sql" keeps the ratings in a Postgres materialized view
+RATING_ENGINE = os.getenv("NBA_RATING_ENGINE", "python")
+PLAYER_VALUES_VIEW = "player_values_mv"
+PLAYER_VALUES_SOURCE = PLAYER_VALUES_VIEW if RATING_ENGINE == "sql" else "player_values"
+
+# Where stages hand their output frames to later stages (Parquet, one file per frame)
+HANDOFF_DIR = os.getenv("NBA_HANDOFF_DIR", os.path.join(os.path.dirname(__file__), "handoff"))
+
+# Shrink season frames at ingest (categorical names, downcast integers, minutes parsed once into seconds)
+COMPACT_DTYPES = os.getenv("NBA_COMPACT_DTYPES", "true").lower() in ("1", "true", "yes")
+# Warn when a stage's frame grows past this many MB; 0 disables the check
+MEMORY_BUDGET_MB = float(os.getenv("NBA_MEMORY_BUDGET_MB", "0"))
+
+# Spotrac scraping politeness: one shared request budget and a cap on parallel requests per host.
+# The defaults keep the old pace of one page about every 3 seconds; raise them only if Spotrac allows it
+SPOTRAC_REQUESTS_PER_SECOND = float(os.getenv("SPOTRAC_REQUESTS_PER_SECOND", "0.33"))
+SPOTRAC_MAX_CONCURRENCY_PER_HOST = int(os.getenv("SPOTRAC_MAX_CONCURRENCY_PER_HOST", "1"))
+SPOTRAC_MAX_JITTER = float(os.getenv("SPOTRAC_MAX_JITTER", "0.5"))
+SPOTRAC_TIMEOUT = float(os.getenv("SPOTRAC_TIMEOUT", "20"))
+SPOTRAC_RETRIES = int(os.getenv("SPOTRAC_RETRIES", "3"))
+SPOTRAC_BACKOFF = float(os.getenv("SPOTRAC_BACKOFF", "1.0"))
+
+# Spotrac names without an exact match are fuzzy-matched to NBA players; below this similarity they stay unresolved
+CROSSWALK_MATCH_THRESHOLD = float(os.getenv("NBA_CROSSWALK_MATCH_THRESHOLD", "0.8"))
+
+# Postgres access: the Airflow connection id, or NBA_DATABASE_URL to connect without Airflow
+POSTGRES_CONN_ID = os.getenv("NBA_POSTGRES_CONN_ID", "postgres_nba_financial")
+DATABASE_URL = os.getenv("NBA_DATABASE_URL", "")
+# Connection pool shared by every stage running in the same process
+DB_POOL_SIZE = int(os.getenv("NBA_DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("NBA_DB_MAX_OVERFLOW", "5"))
+DB_POOL_RECYCLE = int(os.getenv("NBA_DB_POOL_RECYCLE", "1800"))
+DB_QUERY_CACHE_SIZE = int(os.getenv("NBA_DB_QUERY_CACHE_SIZE", "500"))
+
+# Per-stage metrics (wall time, rows, API latencies, cache hits, DB round trips) as JSON lines; empty disables them
+METRICS_FILE = os.getenv("NBA_METRICS_FILE", os.path.join(os.path.dirname(__file__), "metrics.jsonl"))
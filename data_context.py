@@ -0,0 +1,71 @@
+from functools import cached_property
+import pandas as pd
+from compact_dtypes import compact_frame, check_memory_budget
+import config
+from db import get_conn
+
+
+class PipelineDataContext:
+    """Source tables for one pipeline run.
+
+    Nothing is queried when the context is created. Each table is loaded the first time
+    a stage asks for it and then reused for the rest of the run, so stages that share a
+    context never scan the same table twice.
+
+    Only `season` is read, so each season-partitioned stats table scans one partition.
+    With skip_rated_games=True only games that have no rows in player_values yet are
+    loaded, for incremental rating runs. player_values must exist in that case.
+    """
+
+    def __init__(self, conn_id=config.POSTGRES_CONN_ID, skip_rated_games=False, season=config.SEASON):
+        self.conn_id = conn_id
+        self.skip_rated_games = skip_rated_games
+        self.season = season
+
+    def _games_filter(self, table):
+        where = "WHERE season_year = %s"
+        if self.skip_rated_games:
+            where += f" AND NOT EXISTS (SELECT 1 FROM player_values pv WHERE pv.game_id = {table}.game_id)"
+        return where
+
+    def _fetch_frame(self, query):
+        conn = get_conn(self.conn_id)
+        cur = conn.cursor()
+
+        cur.execute(query, (self.season,))
+        rows = cur.fetchall()
+        frame = pd.DataFrame(rows, columns=[desc[0] for desc in cur.description])
+
+        cur.close()
+        conn.close()
+        return frame
+
+    @cached_property
+    def player_boxscore(self):
+        return self._fetch_frame(f"""
+                    SELECT season_year, player_id, player_name, team_id, team_abbreviation, team_name,
+                        game_id, game_date, matchup, wl, min, fgm, fga, fg_pct, fg3m, fg3a, fg3_pct,
+                        ftm, fta, ft_pct, oreb, dreb, reb, ast, tov, stl, blk, pf, pts, plus_minus
+                    FROM nba_regular_season_player_stats
+                    {self._games_filter('nba_regular_season_player_stats')}""")
+
+    @cached_property
+    def advanced_player_stats(self):
+        return self._fetch_frame(f"""
+                    SELECT  game_id, player_id, player_name, team_id, team_abbreviation, min,
+                        off_rating, def_rating, net_rating, ast_pct, ast_ratio,
+                        oreb_pct, dreb_pct, reb_pct, efg_pct, ts_pct, usg_pct, pie
+                    FROM nba_advanced_player_stats
+                    {self._games_filter('nba_advanced_player_stats')}""")
+
+    @cached_property
+    def combined_player_stats(self):
+        combined_df = pd.merge(
+                    self.player_boxscore,
+                    self.advanced_player_stats,
+                    on=['game_id', 'player_id', 'player_name', 'team_id', 'team_abbreviation'],
+                    suffixes=('', '_adv')
+                    )
+        combined_df = compact_frame(combined_df, 'player_game_stats')
+        check_memory_budget(combined_df, 'combined_player_stats')
+        return combined_df
@@ -0,0 +1,77 @@
+import threading
+import psycopg2.extensions
+from sqlalchemy import create_engine
+import config
+import instrumentation
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    """Cursor that reports every statement it sends as a DB round trip of the running stage"""
+
+    def execute(self, query, vars=None):
+        instrumentation.count('db_round_trips')
+        with instrumentation.timed('db_statement'):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        instrumentation.count('db_round_trips', len(vars_list))
+        with instrumentation.timed('db_statement'):
+            return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        instrumentation.count('db_round_trips')
+        with instrumentation.timed('db_copy'):
+            return super().copy_expert(sql, file, size)
+
+
+def sqlalchemy_url(uri):
+    """Point postgres:// and postgresql:// URIs at the psycopg2 driver, which COPY relies on"""
+    scheme, rest = uri.split('://', 1)
+    if scheme in ('postgres', 'postgresql'):
+        scheme = 'postgresql+psycopg2'
+    return f"{scheme}://{rest}"
+
+
+def database_url(conn_id=config.POSTGRES_CONN_ID):
+    if config.DATABASE_URL:
+        return sqlalchemy_url(config.DATABASE_URL)
+
+    # Airflow is only needed to resolve the connection id, so scripts run with NBA_DATABASE_URL don't import it
+    from airflow.providers.postgres.hooks.postgres import PostgresHook
+    return sqlalchemy_url(PostgresHook(postgres_conn_id=conn_id).get_uri())
+
+
+def get_engine(conn_id=config.POSTGRES_CONN_ID):
+    """The process-wide pooled engine for `conn_id`, created on first use.
+
+    Connections are checked with a ping before they are handed out and recycled after
+    NBA_DB_POOL_RECYCLE seconds, and compiled statements are cached across calls, so
+    stages and repeated to_sql uploads reuse both the connections and the SQL.
+    """
+    with _engines_lock:
+        engine = _engines.get(conn_id)
+        if engine is None:
+            url = database_url(conn_id)
+            connect_args = {'cursor_factory': CountingCursor} if url.startswith('postgresql+psycopg2://') else {}
+            engine = create_engine(
+                url,
+                connect_args=connect_args,
+                pool_size=config.DB_POOL_SIZE,
+                max_overflow=config.DB_MAX_OVERFLOW,
+                pool_pre_ping=True,
+                pool_recycle=config.DB_POOL_RECYCLE,
+                query_cache_size=config.DB_QUERY_CACHE_SIZE,
+            )
+            _engines[conn_id] = engine
+        return engine
+
+
+def get_conn(conn_id=config.POSTGRES_CONN_ID):
+    """A psycopg2 connection borrowed from the pool; close() hands it back instead of disconnecting"""
+    return get_engine(conn_id).raw_connection()
+
@@ -0,0 +1,147 @@
+import os
+import pickle
+import pandas as pd
+from nba_api.stats.endpoints import boxscoreadvancedv2
+import config
+from boxscore_cache import BoxscoreCache, default_cache_file
+from compact_dtypes import compact_frame
+from fetch_and_load_players_metrics import advanced_player_metrics_to_postgres
+from fetch_and_load_team_metrics import advanced_team_metrics_to_postgres
+from fetch_engine import iter_fetch
+from high_water_mark import get_loaded_game_ids
+from instrumentation import count, record_rows, stage
+from schedule import regular_season_game_ids
+from seasons import game_in_season
+
+cache_dir = os.path.dirname(__file__)
+legacy_cache_file = os.path.join(cache_dir, "boxscore_cache.pkl")
+legacy_player_cache_file = os.path.join(cache_dir, "player_cache.pkl")
+legacy_team_cache_file = os.path.join(cache_dir, "team_cache.pkl")
+
+
+def _load_pickle(path):
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    return {}
+
+
+def season_cache_file(season=config.SEASON):
+    return os.path.join(cache_dir, f"boxscore_cache_{season}.sqlite")
+
+
+def _legacy_cached_games():
+    """Games from the caches kept before there was one store per season: the shared SQLite file and the pickles"""
+    cached_data = {}
+    if os.path.exists(default_cache_file):
+        with BoxscoreCache(default_cache_file) as legacy_cache:
+            for game_id in legacy_cache.game_ids():
+                cached_data[game_id] = legacy_cache.get(game_id)
+
+    for game_id, frames in _load_pickle(legacy_cache_file).items():
+        cached_data.setdefault(game_id, frames)
+
+    legacy_players = _load_pickle(legacy_player_cache_file)
+    legacy_teams = _load_pickle(legacy_team_cache_file)
+    for game_id in legacy_players.keys() & legacy_teams.keys():
+        cached_data.setdefault(game_id, (legacy_players[game_id], legacy_teams[game_id]))
+
+    return cached_data
+
+
+def open_boxscore_cache(season=config.SEASON):
+    """Open the season's per-game boxscore store, seeding an empty one with that season's games from the old caches"""
+    cache = BoxscoreCache(season_cache_file(season))
+    if len(cache) == 0:
+        cached_data = {
+            game_id: frames for game_id, frames in _legacy_cached_games().items()
+            if game_in_season(game_id, season)
+        }
+        if cached_data:
+            print(f"Imported {cache.import_pickle(cached_data)} {season} games from the older caches")
+
+    return cache
+
+
+def fetch_boxscore(game_id, timeout):
+    boxscore_adv = boxscoreadvancedv2.BoxScoreAdvancedV2(game_id=game_id, timeout=timeout)
+    frames = boxscore_adv.get_data_frames()
+    return frames[0], frames[1]
+
+
+def _compact_chunk(player_frames, team_frames, season):
+    player_chunk = pd.concat(player_frames, ignore_index=True).assign(SEASON_YEAR=season)
+    team_chunk = pd.concat(team_frames, ignore_index=True).assign(SEASON_YEAR=season)
+    return compact_frame(player_chunk, 'advanced_player_stats'), compact_frame(team_chunk, 'advanced_team_stats')
+
+
+def iter_boxscore_chunks(chunk_size=config.BOXSCORE_CHUNK_SIZE, delta=config.DELTA_MODE, season=config.SEASON):
+    """Yield (player_stats, team_stats) frames covering at most `chunk_size` games each, in game order.
+
+    In delta mode games of `season` already loaded into both advanced stats tables are skipped.
+    """
+    unique_game_ids = regular_season_game_ids(season)
+    if delta:
+        loaded_game_ids = (get_loaded_game_ids('nba_advanced_player_stats', season)
+                           & get_loaded_game_ids('nba_advanced_team_stats', season))
+        unique_game_ids = [game_id for game_id in unique_game_ids if game_id not in loaded_game_ids]
+        print(f"Delta mode: {len(unique_game_ids)} games not loaded yet")
+
+    cache = open_boxscore_cache(season)
+
+    cached_game_ids = cache.game_ids()
+    missing_game_ids = [game_id for game_id in unique_game_ids if game_id not in cached_game_ids]
+    print(f"{len(unique_game_ids) - len(missing_game_ids)}/{len(unique_game_ids)} games cached, fetching {len(missing_game_ids)}")
+    count('boxscore_cache_hits', len(unique_game_ids) - len(missing_game_ids))
+    count('boxscore_cache_misses', len(missing_game_ids))
+
+    fetched = iter_fetch(missing_game_ids, fetch_boxscore, return_exceptions=True)
+    errors = []
+    player_frames = []
+    team_frames = []
+
+    try:
+        for game_id in unique_game_ids:
+            if game_id in cached_game_ids:
+                player_metrics, team_metrics = cache.get(game_id)
+            else:
+                result = next(fetched)
+                if isinstance(result, Exception):
+                    errors.append(result)
+                    continue
+                player_metrics, team_metrics = result
+                cache.put(game_id, player_metrics, team_metrics)
+
+            player_frames.append(player_metrics)
+            team_frames.append(team_metrics)
+
+            if len(player_frames) == chunk_size:
+                yield _compact_chunk(player_frames, team_frames, season)
+                player_frames = []
+                team_frames = []
+
+        if player_frames:
+            yield _compact_chunk(player_frames, team_frames, season)
+    finally:
+        fetched.close()
+        cache.close()
+
+    if errors:
+        raise errors[0]
+
+
+def load_boxscores(delta=config.DELTA_MODE, season=config.SEASON):
+    """Fetch BoxScoreAdvancedV2 once per game and load both result sets, one chunk at a time"""
+    with stage('boxscores'):
+        for advanced_player_stats, advanced_team_stats in iter_boxscore_chunks(delta=delta, season=season):
+            record_rows(len(advanced_player_stats))
+            advanced_player_metrics_to_postgres(advanced_player_stats)
+            advanced_team_metrics_to_postgres(advanced_team_stats)
+
+        with BoxscoreCache(season_cache_file(season)) as cache:
+            cache.compact()
+
+
+if __name__ == "__main__":
+    load_boxscores()
+    print("Data loaded to PostgreSQL!")
@@ -1,113 +1,68 @@
-from nba_api.stats.endpoints import leaguegamefinder
-from airflow.providers.postgres.hooks.postgres import PostgresHook
+from db import get_conn
 import pandas as pd
 import numpy as np
 import psycopg2
+from bulk_load import copy_upsert
 import os
+import config
+from high_water_mark import get_loaded_game_ids, get_max_game_date
+from instrumentation import instrumented, record_rows
+from migrations import migrate
+from schedule import season_schedule
 
-nba_teams = [
-    "ATL", "BKN", "BOS", "CHA", "CHI", "CLE", "DAL", "DEN", "DET",
-    "GSW", "HOU", "IND", "LAC", "LAL", "MEM", "MIA", "MIL", "MIN",
-    "NOP", "NYK", "OKC", "ORL", "PHI", "PHX", "POR", "SAC", "SAS",
-    "TOR", "UTA", "WAS"
-]
 
+@instrumented('fetch_nba_games')
+def fetch_nba_data(delta=config.DELTA_MODE, season=config.SEASON):
+    date_from = None
+    loaded_game_ids = set()
+    if delta:
+        date_from = get_max_game_date('nba_regular_season_games', season)
+        loaded_game_ids = get_loaded_game_ids('nba_regular_season_games', season)
 
-def fetch_nba_data():
-    gamefinder = leaguegamefinder.LeagueGameFinder(season_nullable='2024-25')
-    games = gamefinder.get_data_frames()[0]
+    # the shared schedule is already limited to the season's NBA regular-season games; a delta
+    # run refetches it unless it is a few minutes old, since games still in progress change
+    games = season_schedule(season, config.SCHEDULE_DELTA_TTL if delta else config.SCHEDULE_CACHE_TTL)
+    # games from the high-water mark on are upserted again, since one loaded while in progress or
+    # before a stat correction may have changed; earlier games are only loaded if they are missing
+    recent = games['GAME_DATE'] >= date_from.isoformat() if date_from is not None else False
+    nba_regular_season_games = games[recent | ~games['GAME_ID'].isin(loaded_game_ids)]
 
-    nba_games = games[games['TEAM_ABBREVIATION'].isin(nba_teams)]
-    start_date = "2024-10-22"
-    end_date = "2025-04-14"
-
-
-    nba_regular_season_games = nba_games[(nba_games['GAME_DATE'] > start_date) & (nba_games['GAME_DATE'] < end_date)]
-
-    return nba_regular_season_games
+    return nba_regular_season_games.assign(SEASON_YEAR=season)
 
 
 
 
+@instrumented('load_nba_games')
 def load_to_postgres(nba_regular_season_games):
+    if nba_regular_season_games.empty:
+        print('No new rows to load')
+        return
+
+    migrate()
 
-    pg_hook = PostgresHook(postgres_conn_id='postgres_nba_financial')
-    conn = pg_hook.get_conn()
+    conn = get_conn()
     cur = conn.cursor()
 
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS nba_regular_season_games (
-            SEASON_ID VARCHAR,
-            TEAM_ID INT,
-            TEAM_ABBREVIATION VARCHAR,
-            TEAM_NAME VARCHAR,
-            GAME_ID VARCHAR,
-            GAME_DATE DATE,
-            MATCHUP VARCHAR,
-            WL VARCHAR,
-            MIN INT,
-            PTS INT,
-            FGM INT,
-            FGA INT,
-            FG_PCT DOUBLE PRECISION,
-            FG3M INT,
-            FG3A INT,
-            FG3_PCT DOUBLE PRECISION,
-            FTM INT,
-            FTA INT,
-            FT_PCT DOUBLE PRECISION,
-            OREB INT,
-            DREB INT,
-            REB INT,
-            AST INT,
-            STL INT,
-            BLK INT,
-            TOV INT,
-            PF INT,
-            PLUS_MINUS DOUBLE PRECISION,
-            CONSTRAINT nba_regular_season_games_unique UNIQUE (GAME_ID, TEAM_ABBREVIATION)
-        )
-    """)
-
-
-    nba_game_data = nba_regular_season_games.to_records(index=False).tolist()
-
-    cur.executemany("""
-        INSERT INTO nba_regular_season_games (
-            SEASON_ID, TEAM_ID, TEAM_ABBREVIATION, TEAM_NAME, GAME_ID, GAME_DATE, 
-            MATCHUP, WL, MIN, PTS, FGM, FGA, FG_PCT, FG3M, FG3A, FG3_PCT, FTM, FTA, 
-            FT_PCT, OREB, DREB, REB, AST, STL, BLK, TOV, PF, PLUS_MINUS
-        ) 
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (GAME_ID, TEAM_ABBREVIATION) DO UPDATE SET 
-            SEASON_ID = EXCLUDED.SEASON_ID,
-            TEAM_ID = EXCLUDED.TEAM_ID,
-            TEAM_ABBREVIATION = EXCLUDED.TEAM_ABBREVIATION,
-            TEAM_NAME = EXCLUDED.TEAM_NAME,
-            GAME_DATE = EXCLUDED.GAME_DATE,
-            MATCHUP = EXCLUDED.MATCHUP,
-            WL = EXCLUDED.WL,
-            MIN = EXCLUDED.MIN,
-            PTS = EXCLUDED.PTS,
-            FGM = EXCLUDED.FGM,
-            FGA = EXCLUDED.FGA,
-            FG_PCT = EXCLUDED.FG_PCT,
-            FG3M = EXCLUDED.FG3M,
-            FG3A = EXCLUDED.FG3A,
-            FG3_PCT = EXCLUDED.FG3_PCT,
-            FTM = EXCLUDED.FTM,
-            FTA = EXCLUDED.FTA,
-            FT_PCT = EXCLUDED.FT_PCT,
-            OREB = EXCLUDED.OREB,
-            DREB = EXCLUDED.DREB,
-            REB = EXCLUDED.REB,
-            AST = EXCLUDED.AST,
-            STL = EXCLUDED.STL,
-            BLK = EXCLUDED.BLK,
-            TOV = EXCLUDED.TOV,
-            PF = EXCLUDED.PF,
-            PLUS_MINUS = EXCLUDED.PLUS_MINUS;
-    """, nba_game_data)
+    columns = [
+        'SEASON_ID', 'TEAM_ID', 'TEAM_ABBREVIATION', 'TEAM_NAME', 'GAME_ID', 'GAME_DATE', 'MATCHUP',
+        'WL', 'MIN', 'PTS', 'FGM', 'FGA', 'FG_PCT', 'FG3M', 'FG3A', 'FG3_PCT', 'FTM', 'FTA',
+        'FT_PCT', 'OREB', 'DREB', 'REB', 'AST', 'STL', 'BLK', 'TOV', 'PF', 'PLUS_MINUS', 'SEASON_YEAR'
+    ]
+
+    update_columns = [
+        'SEASON_ID', 'TEAM_ID', 'TEAM_ABBREVIATION', 'TEAM_NAME', 'GAME_DATE', 'MATCHUP', 'WL',
+        'MIN', 'PTS', 'FGM', 'FGA', 'FG_PCT', 'FG3M', 'FG3A', 'FG3_PCT', 'FTM', 'FTA', 'FT_PCT',
+        'OREB', 'DREB', 'REB', 'AST', 'STL', 'BLK', 'TOV', 'PF', 'PLUS_MINUS', 'SEASON_YEAR'
+    ]
+
+    loaded_rows = copy_upsert(
+        cur, nba_regular_season_games, 'nba_regular_season_games',
+        columns=columns,
+        conflict_columns=['GAME_ID', 'TEAM_ABBREVIATION'],
+        update_columns=update_columns,
+    )
+    record_rows(loaded_rows)
+    print(f"Upserted {loaded_rows} rows into nba_regular_season_games")
 
 
     conn.commit()
@@ -0,0 +1,140 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import instrumentation
+
+
+class TokenBucket:
+    """Thread-safe token bucket: allows `rate` acquisitions per second with bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class FetchStats:
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.elapsed = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def requests_per_second(self):
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f"{self.requests} requests in {self.elapsed:.2f} seconds "
+                f"({self.requests_per_second:.2f} req/s, {self.retries} retries, {self.failures} failures)")
+
+
+def _fetch_with_retries(fetch, key, bucket, stats, timeout, retries, backoff):
+    for attempt in range(retries + 1):
+        bucket.acquire()
+        with stats.lock:
+            stats.requests += 1
+        instrumentation.count('api_requests')
+        try:
+            with instrumentation.timed('api_call'):
+                return fetch(key, timeout=timeout)
+        except Exception:
+            if attempt == retries:
+                with stats.lock:
+                    stats.failures += 1
+                instrumentation.count('api_failures')
+                raise
+            with stats.lock:
+                stats.retries += 1
+            instrumentation.count('api_retries')
+            time.sleep(backoff * 2 ** attempt)
+
+
+def iter_fetch(keys, fetch,
+               rate=config.NBA_API_REQUESTS_PER_SECOND,
+               burst=config.NBA_API_BURST,
+               max_workers=config.NBA_API_WORKERS,
+               timeout=config.NBA_API_TIMEOUT,
+               retries=config.NBA_API_RETRIES,
+               backoff=config.NBA_API_BACKOFF,
+               return_exceptions=False,
+               stats=None):
+    """Yield `fetch(key, timeout=...)` for every key, in the order of `keys`.
+
+    Requests run on a bounded worker pool under a shared token-bucket budget. At most
+    a few results per worker are held in flight, so memory stays flat however many
+    keys there are. With `return_exceptions=True` a key that still fails after its
+    retries yields its exception instead of aborting the whole batch.
+    """
+    keys = list(keys)
+    stats = stats if stats is not None else FetchStats()
+    if not keys:
+        return
+
+    bucket = TokenBucket(rate, burst)
+    window = max_workers * 4
+    start_time = time.time()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        remaining_keys = iter(keys)
+
+        def submit_next():
+            for key in remaining_keys:
+                # each request runs in a copy of the caller's context, so its metrics land in the caller's stage
+                pending.append(executor.submit(contextvars.copy_context().run,
+                                               _fetch_with_retries, fetch, key, bucket, stats, timeout, retries, backoff))
+                return
+
+        for _ in range(window):
+            submit_next()
+
+        try:
+            for i in range(1, len(keys) + 1):
+                future = pending.popleft()
+                submit_next()
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    result = e
+
+                elapsed_time = time.time() - start_time
+                remaining_time = (elapsed_time / i) * (len(keys) - i)
+                print(f"Fetched {i}/{len(keys)}. Estimated time left: {remaining_time:.2f} seconds")
+
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+            stats.elapsed = time.time() - start_time
+            print(f"Fetch engine: {stats}")
+
+
+def fetch_all(keys, fetch, **kwargs):
+    """Like iter_fetch, but collect the results into a list and return it with the FetchStats"""
+    stats = FetchStats()
+    results = list(iter_fetch(keys, fetch, stats=stats, **kwargs))
+    return results, stats
@@ -1,218 +1,333 @@
 import pandas as pd
 import numpy as np
+import config
 import psycopg2
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from airflow.providers.postgres.hooks.postgres import PostgresHook
+from db import get_conn
+from data_context import PipelineDataContext
+from bulk_load import copy_upsert
+from instrumentation import instrumented, record_rows
+from seasons import ensure_season_column
+
+
+
+@instrumented('read_player_game_stats')
+def get_data_from_postgres(context=None):
+    """Player box score and advanced stats merged per game, loaded through the run's data context"""
+    if context is None:
+        context = PipelineDataContext()
+    return context.combined_player_stats
+
+
+box_score_off_weights = {
+    'pts': 0.033,
+    'ast': 0.07,
+    'oreb': 0.05,
+    'tov': -0.07,
+    'fg_pct': 0.5,
+    'fg3_pct': 0.4,
+    'ft_pct': 0.2,
+    'min': 0.0025,
+    'plus_minus': 0.04
+}
+
+box_score_def_weights = {
+    'dreb': 0.1,
+    'stl': 0.15,
+    'blk': 0.10,
+    'pf': -0.02,
+    'min': 0.0025
+}
+
+advanced_weights = {
+    'off_rating': 0.15,
+    'def_rating': -0.15,
+    'net_rating': 0.0,
+    'ast_pct': 0.12,
+    'reb_pct': 0.10,
+    'ts_pct': 0.25,
+    'usg_pct': 0.08,
+    'pie': 0.35,
+    'min': 0.0025
+}
+
+opponent_strength_weight = 0.15
+
+
+def weighted_rating(games, weights):
+    """Weighted sum of the stat columns in `weights` for every row, counting missing stats as 0"""
+    stats = [stat for stat in weights if stat in games.columns]
+    weight_vector = np.array([weights[stat] for stat in stats], dtype=float)
+    weighted_stats = games[stats].astype(float).fillna(0).to_numpy() * weight_vector
+
+    # add the weighted columns one at a time, in dict order, so the float results are
+    # bit-for-bit the ones the old per-row loop produced
+    rating = np.zeros(len(games))
+    for column in weighted_stats.T:
+        rating += column
+    return rating
+
+
+def rate_player_games(games):
+    """Compute the minutes-scaled game rating for every player-game row as column-wise array operations"""
+    off_box_score_rating = weighted_rating(games, box_score_off_weights)
+    def_box_score_rating = weighted_rating(games, box_score_def_weights)
+    advanced_rating = weighted_rating(games, advanced_weights)
+
+    wl_bonus = np.where(games['wl'] == 'W', 2, 0)
+
+    off_game_rating = off_box_score_rating + advanced_rating + wl_bonus
+    def_game_rating = def_box_score_rating + advanced_rating + wl_bonus
+    game_rating = off_game_rating + def_game_rating + advanced_rating + wl_bonus
+
+    minutes = games['min'].astype(float)
+    minutes_factor = np.fmin(1.0, minutes.to_numpy() / 36)
+    game_rating = game_rating * minutes_factor
+
+    return pd.DataFrame({
+        'player_id': games['player_id'],
+        'player_name': games['player_name'],
+        'team': games['team_abbreviation'],
+        'game_id': games['game_id'],
+        'game_date': games['game_date'],
+        'season_year': games['season_year'],
+        'is_home_game': games['home_game'],
+        'wl_numeric': games['wl_numeric'],
+        'minutes': minutes,
+        'rating': game_rating,
+    }, index=games.index)
+
+
+def parse_matchups(matchup):
+    """Split matchups like 'BOS vs. NYK' / 'BOS @ NYK' into the home flag and the opponent in one vectorized pass"""
+    return pd.DataFrame({
+        'home_game': np.where(matchup.str.contains('vs.', regex=False), 'Y', 'N'),
+        'opponent_team_abbreviation': matchup.str.extract(r' (?:@|vs\.) (.*)', expand=False),
+    }, index=matchup.index)
+
+
+@instrumented('calculate_player_values')
+def calculate_player_stats_value(combined_df):
+    matchups = parse_matchups(combined_df['matchup'])
+    data = combined_df.assign(
+        home_game=matchups['home_game'],
+        wl_numeric=(combined_df['wl'] == 'W').astype(int),
+    )
+
+    df_base = rate_player_games(data)
+
+    # team and opponent share one categorical dtype, so the joins below compare small integer codes
+    teams = pd.concat([df_base['team'], matchups['opponent_team_abbreviation']]).dropna().unique()
+    team_dtype = pd.CategoricalDtype(sorted(teams))
+    df_base['team'] = df_base['team'].astype(team_dtype)
+    df_base['opponent_team_abbreviation'] = matchups['opponent_team_abbreviation'].astype(team_dtype)
+    df_base['is_home_game'] = df_base['is_home_game'].astype('category')
+
+    # opponent strength is the mean rating of the opposing team's players in that game, so
+    # aggregate once per (game_id, team) and look it up, rather than pairing every player
+    # with every opponent
+    team_game_strength = (
+        df_base
+        .groupby(['game_id', 'team'], observed=True)['rating']
+        .mean()
+        .rename('opponent_strength')
+    )
 
+    df_with_opp_str = df_base.join(team_game_strength, on=['game_id', 'opponent_team_abbreviation'])
 
+    df_with_opp_str['player_game_value'] = df_with_opp_str['rating'] + (df_with_opp_str['opponent_strength'] * opponent_strength_weight)
 
-def get_data_from_postgres():
+    return df_with_opp_str
 
-    pg_hook = PostgresHook(postgres_conn_id='postgres_nba_financial')
-    conn = pg_hook.get_conn()
 
-    cur = conn.cursor()
+player_values_column_types = {
+    'player_id': 'INT',
+    'player_name': 'VARCHAR(100)',
+    'team': 'VARCHAR(10)',
+    'game_id': 'VARCHAR(20)',
+    'game_date': 'DATE',
+    'is_home_game': 'VARCHAR(1)',
+    'wl_numeric': 'INT',
+    'minutes': 'DOUBLE PRECISION',
+    'rating': 'DOUBLE PRECISION',
+    'opponent_team_abbreviation': 'VARCHAR(10)',
+    'opponent_strength': 'DOUBLE PRECISION',
+    'player_game_value': 'DOUBLE PRECISION',
+}
+
+player_values_columns = list(player_values_column_types) + ['season_year']
+
+
+def ensure_player_values_table(cur):
+    columns = ",\n            ".join(f"{column} {column_type}" for column, column_type in player_values_column_types.items())
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS player_values (
+            {columns},
+            season_year VARCHAR(9)
+        )
+    """)
 
+    # player_values used to be written by to_sql from a CSV round trip, which parsed game_id
+    # as a number and dropped its leading zeros; the ids are 10 digits, so they are padded back
     cur.execute("""
-                    SELECT season_year, player_id, player_name, team_id, team_abbreviation, team_name,
-                        game_id, game_date, matchup, wl, min, fgm, fga, fg_pct, fg3m, fg3a, fg3_pct,
-                        ftm, fta, ft_pct, oreb, dreb, reb, ast, tov, stl, blk, pf, pts, plus_minus
-                    FROM nba_regular_season_player_stats""")
-            
-    rows = cur.fetchall()
-    
-    player_boxscore = pd.DataFrame(rows, columns=[desc[0] for desc in cur.description])
-
-    
-
+        SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'player_values' AND column_name = 'game_id'
+    """)
+    if cur.fetchone()[0] not in ('character varying', 'text'):
+        cur.execute("""
+            ALTER TABLE player_values
+            ALTER COLUMN game_id TYPE VARCHAR(20) USING lpad(game_id::bigint::text, 10, '0')
+        """)
+        print("Converted player_values.game_id to zero-padded text")
+
+    for column, column_type in player_values_column_types.items():
+        cur.execute(f"ALTER TABLE player_values ADD COLUMN IF NOT EXISTS {column} {column_type}")
+    ensure_season_column(cur, 'player_values', 'game_id')
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS player_values_unique ON player_values (player_id, game_id)")
+    # covers the per-season player averages the features query groups by
     cur.execute("""
-                    SELECT  game_id, player_id, player_name, team_id, team_abbreviation, min,
-                        off_rating, def_rating, net_rating, ast_pct, ast_ratio,
-                        oreb_pct, dreb_pct, reb_pct, efg_pct, ts_pct, usg_pct, pie
-                    FROM nba_advanced_player_stats""")
-                
-    rows = cur.fetchall()
+        CREATE INDEX IF NOT EXISTS player_values_season_player
+        ON player_values (season_year, player_id, team) INCLUDE (player_name, player_game_value)
+    """)
+
 
-    advanced_player_stats = pd.DataFrame(rows, columns=[desc[0] for desc in cur.description])
+def prepare_player_values_table(conn_id=config.POSTGRES_CONN_ID):
+    conn = get_conn(conn_id)
+    cur = conn.cursor()
 
-    
+    ensure_player_values_table(cur)
 
+    conn.commit()
     cur.close()
     conn.close()
 
-    combined_df = pd.merge(
-                    player_boxscore, 
-                    advanced_player_stats,
-                    on=['game_id', 'player_id', 'player_name', 'team_id', 'team_abbreviation'],
-                    suffixes=('', '_adv')
-                    )
-    
-
-    return combined_df
-
-
-data = get_data_from_postgres()
-
-def calculate_player_stats_value(combined_df):
-    player_game_ratings = {}
-    player_data_list = []
-
-
-    box_score_off_weights = {
-            'pts': 0.033,         
-            'ast': 0.07,           
-            'oreb': 0.05,                    
-            'tov': -0.07,                   
-            'fg_pct': 0.5,         
-            'fg3_pct': 0.4,        
-            'ft_pct': 0.2,        
-            'min': 0.0025,         
-            'plus_minus': 0.04
-        }
-
-    box_score_def_weights = {
-            'dreb': 0.1,
-            'stl': 0.15,
-            'blk': 0.10,
-            'pf': -0.02,
-            'min': 0.0025
-        }
-        
-    advanced_weights = {
-            'off_rating': 0.15,    
-            'def_rating': -0.15,   
-            'net_rating': 0.0,     
-            'ast_pct': 0.12,      
-            'reb_pct': 0.10,       
-            'ts_pct': 0.25,         
-            'usg_pct': 0.08,       
-            'pie': 0.35,
-            'min': 0.0025
-        }
-    
-    data['home_game'] = data['matchup'].apply(lambda x: "Y" if 'vs.' in x else "N")
-    data['wl_numeric'] = data['wl'].apply(lambda x: 1 if x == 'W' else 0)
-    
-    for index, game in data.iterrows():
-            player_id = game['player_id']
-            player_name = game['player_name']
-            team_abbreviation = game['team_abbreviation']
-            game_id = game['game_id']
-            game_date = game['game_date']
-            home_game = game['home_game']
-            wl = game['wl_numeric']
-
-
-            minutes = float(game['min'])
-
-            
-            def extract_opponent(game):
-                if '@' in game['matchup']:
-                    return game['matchup'].split(' @ ')[1]
-                elif 'vs' in game['matchup']:
-                    return game['matchup'].split(' vs. ')[1]
-                return None
-
-
-            off_box_score_rating = 0
-            for stat, weight in box_score_off_weights.items():
-                if stat in game and not pd.isna(game[stat]):
-                    off_box_score_rating += game[stat] * weight
-
-            def_box_score_rating = 0
-            for stat, weight in box_score_def_weights.items():
-                if stat in game and not pd.isna(game[stat]):
-                    def_box_score_rating += game[stat] * weight
-            
-            advanced_rating = 0
-            for stat, weight in advanced_weights.items():
-                if stat in game and not pd.isna(game[stat]):
-                    advanced_rating += game[stat] * weight
-
-            wl_bonus = 2 if game['wl'] == 'W' else 0
-
-                       
-            off_game_rating = off_box_score_rating + advanced_rating + wl_bonus
-            def_game_rating = def_box_score_rating + advanced_rating + wl_bonus
-            game_rating = off_game_rating + def_game_rating + advanced_rating + wl_bonus
-
-            minutes_factor = min(1.0, minutes / 36)
-            game_rating *= minutes_factor
-
-            if player_id not in player_game_ratings:
-                player_game_ratings[player_id] = {}
-
-            player_game_ratings[player_id][game_id] = (off_game_rating, def_game_rating, game_rating)
-
-            player_data_list.append({
-                'player_id': player_id,
-                'player_name': player_name,
-                'team': team_abbreviation,
-                'game_id': game_id,
-                'game_date': game_date,
-                'is_home_game': home_game,
-                'wl_numeric': wl,
-                'minutes': minutes,
-                'rating': game_rating,
-            })
-    game_ratings_df = pd.DataFrame(player_data_list)
-
-    game_ratings_df['opponent_team_abbreviation'] = data.apply(extract_opponent, axis=1)
-
-    df_base = game_ratings_df.copy()
-
-    opponents_df = df_base[['player_id', 'team', 'game_id', 'rating']].copy()
-
-
-    df_merged = df_base.merge(
-    opponents_df,
-    left_on=['opponent_team_abbreviation', 'game_id'],  
-    right_on=['team', 'game_id'],         
-    how='left',
-    suffixes=('', '_opponent')
-)
-
-    opponent_strength = (
-        df_merged
-        .groupby(['player_id', 'game_id'])['rating_opponent']
-        .mean()
-        .reset_index()
-        .rename(columns={'rating_opponent': 'opponent_strength'})
-)
-    
-    df_with_opp_str = df_base.merge(opponent_strength, on=['player_id', 'game_id'], how='left')
 
-    opponent_strength_weight = 0.15
-
-    df_with_opp_str['player_game_value'] = df_with_opp_str['rating'] + (df_with_opp_str['opponent_strength'] * opponent_strength_weight)
-
-    csv_filename = f"player_values.csv"
-    df_with_opp_str.to_csv(csv_filename, index=False)
+@instrumented('upsert_player_values')
+def upsert_player_values(player_values, replace=False, conn_id=config.POSTGRES_CONN_ID):
+    """Upsert rated games into player_values; replace=True first clears the seasons being recomputed"""
+    conn = get_conn(conn_id)
+    cur = conn.cursor()
 
-    return df_with_opp_str
+    ensure_player_values_table(cur)
+    if replace:
+        cur.execute("DELETE FROM player_values WHERE season_year = ANY(%s)",
+                    (player_values['season_year'].unique().tolist(),))
+
+    loaded_rows = copy_upsert(
+        cur, player_values, 'player_values',
+        columns=player_values_columns,
+        conflict_columns=['player_id', 'game_id'],
+        update_columns=[column for column in player_values_columns if column not in ('player_id', 'game_id')],
+    )
+    record_rows(loaded_rows)
+    print(f"Upserted {loaded_rows} rows into player_values")
+
+    conn.commit()
+    cur.close()
+    conn.close()
 
 
+def _weighted_rating_sql(weights):
+    terms = []
+    for stat, weight in weights.items():
+        # 'min' is the box score minutes, like in the merged frame where the advanced one becomes min_adv
+        table = 'ps' if stat in box_score_off_weights or stat in box_score_def_weights else 'ap'
+        terms.append(f"COALESCE({table}.{stat}, 0)::double precision * {weight}")
+    return "\n                + ".join(terms)
+
+
+def player_values_view_sql():
+    """Materialized view computing the same player_game_value as calculate_player_stats_value, inside Postgres"""
+    return f"""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS {config.PLAYER_VALUES_VIEW} AS
+        WITH games AS (
+            SELECT ps.player_id, ps.player_name, ps.team_abbreviation AS team, ps.game_id, ps.game_date, ps.season_year,
+                CASE WHEN ps.matchup LIKE '%vs.%' THEN 'Y' ELSE 'N' END AS is_home_game,
+                CASE WHEN ps.wl = 'W' THEN 1 ELSE 0 END AS wl_numeric,
+                ps.min::double precision AS minutes,
+                CASE WHEN ps.wl = 'W' THEN 2 ELSE 0 END AS wl_bonus,
+                CASE
+                    WHEN ps.matchup LIKE '%@%' THEN split_part(ps.matchup, ' @ ', 2)
+                    WHEN ps.matchup LIKE '%vs%' THEN split_part(ps.matchup, ' vs. ', 2)
+                END AS opponent_team_abbreviation,
+                {_weighted_rating_sql(box_score_off_weights)} AS off_box_score_rating,
+                {_weighted_rating_sql(box_score_def_weights)} AS def_box_score_rating,
+                {_weighted_rating_sql(advanced_weights)} AS advanced_rating
+            FROM nba_regular_season_player_stats ps
+            JOIN nba_advanced_player_stats ap
+                USING (season_year, game_id, player_id, player_name, team_id, team_abbreviation)
+        ),
+        rated AS (
+            SELECT player_id, player_name, team, game_id, game_date, season_year, is_home_game, wl_numeric, minutes,
+                ((off_box_score_rating + advanced_rating + wl_bonus)
+                    + (def_box_score_rating + advanced_rating + wl_bonus)
+                    + advanced_rating + wl_bonus) * LEAST(1.0, minutes / 36) AS rating,
+                opponent_team_abbreviation
+            FROM games
+        ),
+        team_strength AS (
+            SELECT season_year, game_id, team, AVG(rating) AS opponent_strength
+            FROM rated
+            GROUP BY season_year, game_id, team
+        )
+        SELECT r.*, ts.opponent_strength,
+            r.rating + ts.opponent_strength * {opponent_strength_weight} AS player_game_value
+        FROM rated r
+        LEFT JOIN team_strength ts
+            ON ts.season_year = r.season_year AND ts.game_id = r.game_id AND ts.team = r.opponent_team_abbreviation
+    """
 
-def upload_to_postgresql(file_path, table_name, conn_id='postgres_nba_financial'):
-    df = pd.read_csv(file_path)
 
-        
-    pg_hook = PostgresHook(postgres_conn_id=conn_id)
-        
-    conn = pg_hook.get_conn()
-    engine = create_engine(
-            f"postgresql+psycopg2://{pg_hook.get_uri().split('://')[1]}"
-        )
-    
-    df.to_sql(table_name, engine, if_exists='replace', index=False)
+@instrumented('refresh_player_values_view')
+def refresh_player_values_view(rebuild=False, conn_id=config.POSTGRES_CONN_ID):
+    """Create or refresh the player_game_value materialized view so ratings are computed without leaving the database.
 
-    engine.dispose()
+    Pass rebuild=True after changing the weights, since an existing view keeps the definition it was created with.
+    """
+    conn = get_conn(conn_id)
+    cur = conn.cursor()
 
+    if rebuild:
+        # the rollups built on the view go with it; refresh_rollups creates them again
+        cur.execute(f"DROP MATERIALIZED VIEW IF EXISTS {config.PLAYER_VALUES_VIEW} CASCADE")
+
+    # both stats tables are partitioned the same way, so the join runs one season at a time
+    cur.execute("SET LOCAL enable_partitionwise_join = on")
+
+    cur.execute("SELECT to_regclass(%s)", (config.PLAYER_VALUES_VIEW,))
+    exists = cur.fetchone()[0] is not None
+
+    if exists:
+        cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {config.PLAYER_VALUES_VIEW}")
+    else:
+        cur.execute(player_values_view_sql())
+        cur.execute(f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS {config.PLAYER_VALUES_VIEW}_unique
+            ON {config.PLAYER_VALUES_VIEW} (player_id, game_id)
+        """)
+        cur.execute(f"""
+            CREATE INDEX IF NOT EXISTS {config.PLAYER_VALUES_VIEW}_season_player
+            ON {config.PLAYER_VALUES_VIEW} (season_year, player_id, team) INCLUDE (player_name, player_game_value)
+        """)
+
+    conn.commit()
+    cur.close()
+    conn.close()
 
 if __name__ == "__main__":
-    players_data = get_data_from_postgres()
-    calculate_player_stats_value(players_data)
-    upload_to_postgresql("player_values.csv", "player_values", conn_id='postgres_nba_financial')
+    if config.RATING_ENGINE == 'sql':
+        refresh_player_values_view()
+    else:
+        incremental = config.DELTA_MODE
+        if incremental:
+            prepare_player_values_table()
+
+        context = PipelineDataContext(skip_rated_games=incremental)
+        players_data = get_data_from_postgres(context)
+        if players_data.empty:
+            print("No new games to rate")
+        else:
+            player_values = calculate_player_stats_value(players_data)
+            upsert_player_values(player_values, replace=not incremental)
     print("Data loaded to PostgreSQL!")
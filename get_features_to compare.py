@@ -3,51 +3,17 @@ import numpy as np
 import psycopg2
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from airflow.providers.postgres.hooks.postgres import PostgresHook
-import re
-import unicodedata
+from bulk_load import copy_rows
+from db import get_conn
+import config
+from handoff import read_frame, write_frame
+from instrumentation import instrumented, record_rows, stage
+from player_crosswalk import ensure_player_crosswalk_table, update_player_crosswalk
+from rollups import refresh_rollups
 
 
 
-def get_data_from_postgres():
-    pg_hook = PostgresHook(postgres_conn_id='postgres_nba_financial')
-    conn = pg_hook.get_conn()
-
-    cur = conn.cursor()
-
-    def clean_player_name(name):
-        name = unicodedata.normalize('NFD', name)
-        name = ''.join(c for c in name if unicodedata.category(c) != 'Mn')
-
-        name = re.sub(r'\b(Jr\.?|Sr\.?|III|II|IV)\b', '', name)
-
-        name = re.sub(r'\s+', ' ', name)
-
-        return name.strip().lower()
-
-    cur.execute("""
-                SELECT player_name AS "Player", team AS "team_abbreviation" ,AVG(player_game_value) AS "value_avg"
-                FROM player_values
-                GROUP BY player_name,team""")
-    
-    rows = cur.fetchall()
-
-    player_value = pd.DataFrame(rows, columns=[desc[0] for desc in cur.description])
-
-    player_value['Team'] = player_value['Team'].replace('LA Clippers', 'Los Angeles Clippers')
-
-    cur.execute("""
-                SELECT * FROM nba_salaries""")
-    rows = cur.fetchall()
-
-    salaries = pd.DataFrame(rows, columns=[desc[0] for desc in cur.description])
-
-    player_value['player_clean'] = player_value['Player'].apply(clean_player_name)
-    salaries['player_clean'] = salaries['Player'].apply(clean_player_name)
-
-
-    team_name_to_abbr = {
+team_name_to_abbr = {
     'Atlanta Hawks': 'ATL',
     'Boston Celtics': 'BOS',
     'Brooklyn Nets': 'BKN',
@@ -79,84 +45,193 @@ def get_data_from_postgres():
     'Utah Jazz': 'UTA',
     'Washington Wizards': 'WAS'
 }
-    
-    salaries['team_abbreviation'] = salaries['Team'].map(team_name_to_abbr)
 
-    cur.execute("""
-                WITH avg_salary_by_pos AS (
-                    SELECT "Pos", AVG("Cap Hit") AS avg_salary
-                    FROM nba_salaries
-                    GROUP BY "Pos"
-                )           
-                SELECT "Pos", avg_salary
-                FROM avg_salary_by_pos
-                ORDER BY avg_salary DESC;
-                """)
+
+def team_abbreviations_sql():
+    rows = ",\n            ".join(f"('{team_name}', '{abbreviation}')" for team_name, abbreviation in team_name_to_abbr.items())
+    return f"""team_abbreviations (team_name, team_abbreviation) AS (
+        VALUES
+            {rows}
+    )"""
+
+
+# Spotrac lists the Clippers as 'LA Clippers'
+spotrac_team_sql = """CASE WHEN s."Team" = 'LA Clippers' THEN 'Los Angeles Clippers' ELSE s."Team" END"""
+
+
+def round2_sql(expression):
+    # rounded in double precision, where Postgres round() breaks ties to even (on the usual
+    # platforms) like the pandas .round(2) this replaced; ROUND(numeric, 2) rounds them away from zero
+    return f"round(({expression})::double precision * 100) / 100"
+
+
+def unmatched_salaries_sql():
+    """Salary rows whose Spotrac name has no player_id in the crosswalk yet"""
+    return f"""
+        WITH {team_abbreviations_sql()}
+        SELECT s."Player", t.team_abbreviation
+        FROM nba_salaries s
+        LEFT JOIN team_abbreviations t ON t.team_name = {spotrac_team_sql}
+        WHERE NOT EXISTS (
+            SELECT 1 FROM player_crosswalk c
+            WHERE c.spotrac_name = s."Player" AND c.team_abbreviation = t.team_abbreviation
+                AND c.player_id IS NOT NULL
+        )
+    """
+
+
+def player_features_sql():
+    """Feature table in one statement: per-player, per-season value averages joined to that season's
+    salaries through the crosswalk, with the position and team aggregates as window functions.
+
+    Every derived column is rounded before it feeds the next one, in the same order and with the
+    same ties-to-even rounding as the pandas version. A zero salary gives NULL rather than a division error.
+    """
+    return f"""
+        WITH {team_abbreviations_sql()},
+        player_value AS (
+            SELECT season_year, player_id, player_name, team AS team_abbreviation, AVG(player_game_value) AS value_avg
+            FROM {config.PLAYER_VALUES_SOURCE}
+            GROUP BY season_year, player_id, player_name, team
+        ),
+        avg_salary_by_pos AS (
+            SELECT season_year, "Pos", {round2_sql('AVG("Cap Hit")')} AS pos_salary_avg
+            FROM nba_salaries
+            GROUP BY season_year, "Pos"
+        ),
+        salaries AS (
+            SELECT s.season_year, c.player_id, t.team_name AS "Team", t.team_abbreviation, s."Pos", s."Age", s."Cap Hit" AS salary
+            FROM nba_salaries s
+            JOIN team_abbreviations t ON t.team_name = {spotrac_team_sql}
+            JOIN player_crosswalk c ON c.spotrac_name = s."Player" AND c.team_abbreviation = t.team_abbreviation
+                AND c.player_id IS NOT NULL
+        ),
+        features AS (
+            SELECT pv.season_year, pv.player_id, pv.player_name AS "Player", pv.team_abbreviation, s."Team", s."Pos", s."Age",
+                s.salary, pv.value_avg, ap.pos_salary_avg,
+                {round2_sql('AVG(pv.value_avg) OVER (PARTITION BY pv.season_year, s."Pos")')} AS pos_value_avg,
+                {round2_sql('SUM(pv.value_avg) OVER (PARTITION BY pv.season_year, pv.team_abbreviation)')} AS team_value_avg
+            FROM player_value pv
+            JOIN salaries s ON s.season_year = pv.season_year AND s.player_id = pv.player_id
+                AND s.team_abbreviation = pv.team_abbreviation
+            JOIN avg_salary_by_pos ap ON ap.season_year = s.season_year AND ap."Pos" = s."Pos"
+        )
+        SELECT season_year, player_id, "Player", team_abbreviation, "Team", "Pos", "Age", salary,
+            value_avg, pos_salary_avg, pos_value_avg,
+            {round2_sql('value_avg / NULLIF(salary / 1000000.0, 0)')} AS value_per_dollar,
+            {round2_sql('pos_value_avg / NULLIF(pos_salary_avg / 1000000, 0)')} AS value_per_dollar_pos_avg,
+            team_value_avg,
+            {round2_sql('value_avg / NULLIF(team_value_avg, 0) * 100')} AS value_pct_in_team
+        FROM features
+    """
+
+
+@instrumented('player_features')
+def get_data_from_postgres():
+    conn = get_conn()
+
+    cur = conn.cursor()
+
+    ensure_player_crosswalk_table(cur)
+
+    # only names the crosswalk hasn't resolved yet get matched; the feature query joins on player_id
+    cur.execute(unmatched_salaries_sql())
+    unmatched = pd.DataFrame(cur.fetchall(), columns=['Player', 'team_abbreviation'])
+    if not unmatched.empty:
+        cur.execute(f"""
+                    SELECT DISTINCT player_id, player_name, team AS team_abbreviation
+                    FROM {config.PLAYER_VALUES_SOURCE}
+                    WHERE season_year IN (SELECT DISTINCT season_year FROM nba_salaries)""")
+        players = pd.DataFrame(cur.fetchall(), columns=[desc[0] for desc in cur.description])
+        update_player_crosswalk(cur, unmatched, players)
+
+    cur.execute(player_features_sql())
     rows = cur.fetchall()
 
-    avg_salary_by_pos = pd.DataFrame(rows, columns=[desc[0] for desc in cur.description])
+    final_df = pd.DataFrame(rows, columns=[desc[0] for desc in cur.description])
 
+    conn.commit()
     cur.close()
     conn.close()
 
-    combined_df = pd.merge(
-                    player_value, 
-                    salaries,
-                    on=['player_clean'],
-                    how='left',
-                    suffixes=('', '_salaries')
-    )
-   
-    final_df = pd.merge(
-                    combined_df, 
-                    avg_salary_by_pos,
-                    on=['Pos'],
-                    suffixes=('', '_avg_salary')
-                    )
-
-    final_df = final_df.dropna(subset=['team_abbreviation_salaries'])
-    final_df = final_df[final_df["team_abbreviation"] == final_df["team_abbreviation_salaries"]]
-  
-    final_df = final_df.rename(columns={"avg_salary": "pos_salary_avg", "Cap Hit": "salary"})
-    final_df['pos_salary_avg'] = final_df['pos_salary_avg'].astype(float)
-    final_df['pos_salary_avg'] = final_df['pos_salary_avg'].round(2)
-
-    final_df['pos_value_avg'] = final_df.groupby('Pos')['value_avg'].transform('mean')
-    final_df['pos_value_avg'] = final_df['pos_value_avg'].round(2)
-
-    final_df['value_per_dollar'] = final_df['value_avg'] / (final_df['salary'] / 1_000_000)
-    final_df['value_per_dollar'] = final_df['value_per_dollar'].round(2)
-
-    final_df['value_per_dollar_pos_avg'] = final_df['pos_value_avg'] / (final_df['pos_salary_avg'] / 1_000_000)
-    final_df['value_per_dollar_pos_avg'] = final_df['value_per_dollar_pos_avg'].round(2)
-
-    final_df['team_value_avg'] = final_df.groupby('team_abbreviation')['value_avg'].transform('sum')
-    final_df['team_value_avg'] = final_df['team_value_avg'].round(2)
-
-    final_df['value_pct_in_team'] = (final_df['value_avg'] / final_df['team_value_avg']) * 100
-    final_df['value_pct_in_team'] = final_df['value_pct_in_team'].round(2)
-
-    csv_filename = f"player_features_to_compare.csv"
-    final_df.to_csv(csv_filename, index=False)
+    write_frame(final_df, "player_features_to_compare")
 
  
     return final_df 
 
 
 
-def upload_to_postgresql(file_path, table_name):
-    df = pd.read_csv(file_path)
+player_features_columns = [
+    'season_year', 'player_id', 'Player', 'team_abbreviation', 'Team', 'Pos', 'Age', 'salary',
+    'value_avg', 'pos_salary_avg', 'pos_value_avg', 'value_per_dollar', 'value_per_dollar_pos_avg',
+    'team_value_avg', 'value_pct_in_team'
+]
+
 
-    pg_hook = PostgresHook(postgres_conn_id='postgres_nba_financial')
-    
-    engine = create_engine(pg_hook.get_uri())
-    
-    df.to_sql(table_name, engine, if_exists='replace', index=False)
-    print(f"Successfully uploaded data to PostgreSQL table: {table_name}")
+def ensure_player_features_table(cur):
+    # player_features used to be replaced by to_sql on every run; that table has no season_year
+    # and the rollups can't be built on it, so it is created again once
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = 'player_features'
+    """)
+    existing_columns = {row[0] for row in cur.fetchall()}
+    if existing_columns and existing_columns != set(player_features_columns):
+        cur.execute("DROP TABLE player_features")
+
+    # "Age" was text while the salaries handoff kept it as a string
+    cur.execute("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'player_features' AND column_name = 'Age'
+    """)
+    row = cur.fetchone()
+    if row is not None and row[0] != 'integer':
+        cur.execute('ALTER TABLE player_features ALTER COLUMN "Age" TYPE INT USING NULLIF("Age", \'\')::int')
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS player_features (
+            season_year VARCHAR(9),
+            player_id INT,
+            "Player" VARCHAR(100),
+            team_abbreviation VARCHAR(10),
+            "Team" VARCHAR(100),
+            "Pos" VARCHAR(10),
+            "Age" INT,
+            salary DOUBLE PRECISION,
+            value_avg DOUBLE PRECISION,
+            pos_salary_avg DOUBLE PRECISION,
+            pos_value_avg DOUBLE PRECISION,
+            value_per_dollar DOUBLE PRECISION,
+            value_per_dollar_pos_avg DOUBLE PRECISION,
+            team_value_avg DOUBLE PRECISION,
+            value_pct_in_team DOUBLE PRECISION
+        )
+    """)
+
+
+def write_player_features(source):
+    """Rewrite player_features in place with TRUNCATE and COPY.
+
+    The table is never dropped, so the rollup views built on it survive. Readers see the
+    old rows until the new ones commit.
+    """
+    with stage('write_player_features'):
+        df = read_frame(source)
+
+        conn = get_conn()
+        cur = conn.cursor()
+
+        ensure_player_features_table(cur)
+        cur.execute("TRUNCATE player_features")
+        record_rows(copy_rows(cur, df, 'player_features', player_features_columns))
+
+        conn.commit()
+        cur.close()
+        conn.close()
+    print(f"Wrote {len(df)} rows to player_features")
 
-    engine.dispose()
 
 if __name__ == "__main__":
-    data = get_data_from_postgres
-    table_name = "player_features"
-    upload_to_postgresql("player_features_to_compare.csv", table_name)
\ No newline at end of file
+    data = get_data_from_postgres()
+    write_player_features(data)
+    refresh_rollups()
\ No newline at end of file
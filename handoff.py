@@ -0,0 +1,33 @@
+import os
+import pandas as pd
+import config
+
+
+# frames handed off earlier in this process, so stages running in the same task skip the disk entirely
+_frames = {}
+
+
+def frame_path(name):
+    return os.path.join(config.HANDOFF_DIR, f"{name}.parquet")
+
+
+def write_frame(frame, name):
+    """Hand a stage's output frame to later stages, in memory and as Parquet for stages running in other Airflow tasks"""
+    _frames[name] = frame
+    os.makedirs(config.HANDOFF_DIR, exist_ok=True)
+    frame.to_parquet(frame_path(name), index=False)
+    print(f"Handed off {len(frame)} rows as {frame_path(name)}")
+
+
+def read_frame(source):
+    """Return a handed-off frame by name; a DataFrame passed in is returned as is.
+
+    The in-memory copy is released once it has been read, so a long-lived worker doesn't hold
+    every stage's output; reading the same name again falls back to the Parquet file.
+    """
+    if isinstance(source, pd.DataFrame):
+        return source
+    frame = _frames.pop(source, None)
+    if frame is not None:
+        return frame
+    return pd.read_parquet(frame_path(source))
@@ -0,0 +1,52 @@
+from db import get_conn
+
+
+def _table_exists(cur, table):
+    cur.execute("SELECT to_regclass(%s)", (table,))
+    return cur.fetchone()[0] is not None
+
+
+def _season_filter(season):
+    # the stats tables are partitioned by season, so this also keeps the scan to one partition
+    return ("WHERE season_year = %s", (season,)) if season is not None else ("", ())
+
+
+def get_loaded_game_ids(table, season=None):
+    """Return the set of GAME_IDs already loaded into `table` (empty if the table doesn't exist yet), optionally for one season"""
+    conn = get_conn()
+    cur = conn.cursor()
+
+    game_ids = set()
+    if _table_exists(cur, table):
+        where, params = _season_filter(season)
+        cur.execute(f"SELECT DISTINCT game_id FROM {table} {where}", params)
+        game_ids = {row[0] for row in cur.fetchall()}
+
+    cur.close()
+    conn.close()
+    return game_ids
+
+
+def get_max_game_date(table, season=None):
+    """Return the latest GAME_DATE loaded into `table`, or None if nothing is loaded yet.
+
+    With a `season` only that season's games count, so one season's high-water mark isn't
+    pushed forward by a later season loaded into the same table.
+    """
+    conn = get_conn()
+    cur = conn.cursor()
+
+    max_game_date = None
+    if _table_exists(cur, table):
+        where, params = _season_filter(season)
+        cur.execute(f"SELECT MAX(game_date) FROM {table} {where}", params)
+        max_game_date = cur.fetchone()[0]
+
+    cur.close()
+    conn.close()
+    return max_game_date
+
+
+def nba_api_date(game_date):
+    """Format a date the way nba_api's date_from_nullable/date_to_nullable expect it"""
+    return game_date.strftime('%m/%d/%Y') if game_date else ''
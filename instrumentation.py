@@ -0,0 +1,130 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+import pandas as pd
+import config
+
+
+# latency histogram bucket upper bounds, in milliseconds
+latency_buckets_ms = [10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+# the stages the current code runs under, innermost last; worker threads are started with a copy
+# of their caller's context (see fetch_engine.iter_fetch), so their samples go to the caller's stages
+_active_stages = contextvars.ContextVar('active_stages', default=())
+_lock = threading.Lock()
+
+
+class StageMetrics:
+    """What one stage did: rows, named counters and latency samples, gathered from every thread"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.time()
+        self.wall_seconds = 0.0
+        self.rows = 0
+        self.counters = defaultdict(int)
+        self.latencies = defaultdict(list)
+
+    def summary(self):
+        latencies = {}
+        for name, samples in self.latencies.items():
+            samples_ms = sorted(seconds * 1000 for seconds in samples)
+            buckets = [sum(1 for sample in samples_ms if sample <= bound) for bound in latency_buckets_ms]
+            latencies[name] = {
+                'count': len(samples_ms),
+                'p50_ms': round(samples_ms[len(samples_ms) // 2], 1),
+                'p95_ms': round(samples_ms[int(len(samples_ms) * 0.95)], 1),
+                'max_ms': round(samples_ms[-1], 1),
+                # cumulative counts per upper bound, plus everything slower than the last one
+                'buckets': dict(zip([f"le_{bound}" for bound in latency_buckets_ms], buckets), inf=len(samples_ms)),
+            }
+
+        return {
+            'stage': self.name,
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+            'pid': os.getpid(),
+            'wall_seconds': round(self.wall_seconds, 3),
+            'rows': self.rows,
+            'rows_per_second': round(self.rows / self.wall_seconds, 1) if self.wall_seconds else None,
+            'counters': dict(self.counters),
+            'latencies': latencies,
+        }
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage and append its metrics to METRICS_FILE when it ends.
+
+    Counters and latencies recorded while the stage runs, by its own thread or by the
+    workers it starts, count towards it and towards any stage it is nested in; rows only
+    count towards the innermost one. A stage running at the same time in another thread
+    keeps its own samples.
+    """
+    metrics = StageMetrics(name)
+    token = _active_stages.set(_active_stages.get() + (metrics,))
+    start = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        metrics.wall_seconds = time.perf_counter() - start
+        _active_stages.reset(token)
+        _write(metrics.summary())
+
+
+def instrumented(name):
+    """Run the decorated function as a stage; a DataFrame it returns counts as the stage's rows"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name) as metrics:
+                result = fn(*args, **kwargs)
+                if isinstance(result, pd.DataFrame):
+                    metrics.rows += len(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def record_rows(rows):
+    stages = _active_stages.get()
+    with _lock:
+        if stages:
+            stages[-1].rows += rows
+
+
+def count(name, amount=1):
+    with _lock:
+        for metrics in _active_stages.get():
+            metrics.counters[name] += amount
+
+
+def observe(name, seconds):
+    with _lock:
+        for metrics in _active_stages.get():
+            metrics.latencies[name].append(seconds)
+
+
+@contextmanager
+def timed(name):
+    """Record how long the block took as one `name` latency sample, even if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def _write(summary):
+    rate = f", {summary['rows_per_second']:.0f} rows/s" if summary['rows_per_second'] else ""
+    print(f"Stage {summary['stage']}: {summary['wall_seconds']:.2f} s, {summary['rows']} rows{rate}")
+
+    if not config.METRICS_FILE:
+        return
+    with _lock:
+        with open(config.METRICS_FILE, "a") as f:
+            f.write(json.dumps(summary, default=str) + "\n")
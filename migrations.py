@@ -0,0 +1,333 @@
+"""Versioned schema for the tables the loaders write.
+
+Each migration runs once per database, in version order, and is recorded in
+schema_migrations. Loaders call migrate() before they write, so a new database or an
+older one is brought up to date by whichever stage runs first; `python migrations.py`
+does the same by hand. Add a migration to the end of `migrations` rather than editing
+one that has already shipped.
+"""
+import re
+import config
+from db import get_conn
+from seasons import ensure_season_column
+
+
+# any constant works, as long as only schema changes take this advisory lock
+schema_lock_id = 7_240_414
+
+table_columns = {
+    'nba_regular_season_games': """
+            SEASON_ID VARCHAR,
+            TEAM_ID INT,
+            TEAM_ABBREVIATION VARCHAR,
+            TEAM_NAME VARCHAR,
+            GAME_ID VARCHAR,
+            GAME_DATE DATE,
+            MATCHUP VARCHAR,
+            WL VARCHAR,
+            MIN INT,
+            PTS INT,
+            FGM INT,
+            FGA INT,
+            FG_PCT DOUBLE PRECISION,
+            FG3M INT,
+            FG3A INT,
+            FG3_PCT DOUBLE PRECISION,
+            FTM INT,
+            FTA INT,
+            FT_PCT DOUBLE PRECISION,
+            OREB INT,
+            DREB INT,
+            REB INT,
+            AST INT,
+            STL INT,
+            BLK INT,
+            TOV INT,
+            PF INT,
+            PLUS_MINUS DOUBLE PRECISION,
+            SEASON_YEAR VARCHAR(9)""",
+    'nba_regular_season_player_stats': """
+            SEASON_YEAR VARCHAR(9),
+            PLAYER_ID INT,
+            PLAYER_NAME VARCHAR(100),
+            NICKNAME VARCHAR(100),
+            TEAM_ID INT,
+            TEAM_ABBREVIATION VARCHAR(10),
+            TEAM_NAME VARCHAR(100),
+            GAME_ID VARCHAR(20),
+            GAME_DATE DATE,
+            MATCHUP VARCHAR(50),
+            WL VARCHAR(1),
+            MIN DOUBLE PRECISION,
+            FGM INT,
+            FGA INT,
+            FG_PCT DOUBLE PRECISION,
+            FG3M INT,
+            FG3A INT,
+            FG3_PCT DOUBLE PRECISION,
+            FTM INT,
+            FTA INT,
+            FT_PCT DOUBLE PRECISION,
+            OREB INT,
+            DREB INT,
+            REB INT,
+            AST INT,
+            TOV INT,
+            STL INT,
+            BLK INT,
+            BLKA INT,
+            PF INT,
+            PFD INT,
+            PTS INT,
+            PLUS_MINUS DOUBLE PRECISION,
+            NBA_FANTASY_PTS DOUBLE PRECISION,
+            DD2 INT,
+            TD3 INT,
+            MIN_SEC VARCHAR(10)""",
+    'nba_advanced_player_stats': """
+            GAME_ID VARCHAR(20),
+            TEAM_ID INT,
+            TEAM_ABBREVIATION VARCHAR(10),
+            TEAM_CITY VARCHAR(50),
+            PLAYER_ID INT,
+            PLAYER_NAME VARCHAR(100),
+            NICKNAME VARCHAR(50),
+            START_POSITION VARCHAR(10),
+            COMMENT VARCHAR(255),
+            MIN DOUBLE PRECISION,
+            E_OFF_RATING DOUBLE PRECISION,
+            OFF_RATING DOUBLE PRECISION,
+            E_DEF_RATING DOUBLE PRECISION,
+            DEF_RATING DOUBLE PRECISION,
+            E_NET_RATING DOUBLE PRECISION,
+            NET_RATING DOUBLE PRECISION,
+            AST_PCT DOUBLE PRECISION,
+            AST_TOV DOUBLE PRECISION,
+            AST_RATIO DOUBLE PRECISION,
+            OREB_PCT DOUBLE PRECISION,
+            DREB_PCT DOUBLE PRECISION,
+            REB_PCT DOUBLE PRECISION,
+            TM_TOV_PCT DOUBLE PRECISION,
+            EFG_PCT DOUBLE PRECISION,
+            TS_PCT DOUBLE PRECISION,
+            USG_PCT DOUBLE PRECISION,
+            E_USG_PCT DOUBLE PRECISION,
+            E_PACE DOUBLE PRECISION,
+            PACE DOUBLE PRECISION,
+            PACE_PER40 DOUBLE PRECISION,
+            POSS DOUBLE PRECISION,
+            PIE DOUBLE PRECISION,
+            SEASON_YEAR VARCHAR(9)""",
+    'nba_advanced_team_stats': """
+            GAME_ID VARCHAR(20),
+            TEAM_ID INT,
+            TEAM_NAME VARCHAR(100),
+            TEAM_ABBREVIATION VARCHAR(10),
+            TEAM_CITY VARCHAR(100),
+            MIN DOUBLE PRECISION,
+            E_OFF_RATING DOUBLE PRECISION,
+            OFF_RATING DOUBLE PRECISION,
+            E_DEF_RATING DOUBLE PRECISION,
+            DEF_RATING DOUBLE PRECISION,
+            E_NET_RATING DOUBLE PRECISION,
+            NET_RATING DOUBLE PRECISION,
+            AST_PCT DOUBLE PRECISION,
+            AST_TOV DOUBLE PRECISION,
+            AST_RATIO DOUBLE PRECISION,
+            OREB_PCT DOUBLE PRECISION,
+            DREB_PCT DOUBLE PRECISION,
+            REB_PCT DOUBLE PRECISION,
+            E_TM_TOV_PCT DOUBLE PRECISION,
+            TM_TOV_PCT DOUBLE PRECISION,
+            EFG_PCT DOUBLE PRECISION,
+            TS_PCT DOUBLE PRECISION,
+            USG_PCT DOUBLE PRECISION,
+            E_USG_PCT DOUBLE PRECISION,
+            E_PACE DOUBLE PRECISION,
+            PACE DOUBLE PRECISION,
+            PACE_PER40 DOUBLE PRECISION,
+            POSS DOUBLE PRECISION,
+            PIE DOUBLE PRECISION,
+            SEASON_YEAR VARCHAR(9)""",
+}
+
+# the keys each table was created with before it was partitioned
+unpartitioned_keys = {
+    'nba_regular_season_games': ['GAME_ID', 'TEAM_ABBREVIATION'],
+    'nba_regular_season_player_stats': ['PLAYER_ID', 'GAME_ID'],
+    'nba_advanced_player_stats': ['GAME_ID', 'PLAYER_ID'],
+    'nba_advanced_team_stats': ['GAME_ID', 'TEAM_ID'],
+}
+
+# a partitioned table's unique keys have to contain the partition key, so these lead with it
+season_partitioned_keys = {
+    'nba_regular_season_player_stats': ['SEASON_YEAR', 'PLAYER_ID', 'GAME_ID'],
+    'nba_advanced_player_stats': ['SEASON_YEAR', 'GAME_ID', 'PLAYER_ID'],
+    'nba_advanced_team_stats': ['SEASON_YEAR', 'GAME_ID', 'TEAM_ID'],
+}
+
+query_indexes = [
+    # high-water marks and the incremental "not rated yet" filter look games up by id and date
+    ('nba_regular_season_games_game_date_idx', 'nba_regular_season_games', '(GAME_DATE)'),
+    ('nba_regular_season_player_stats_game_idx', 'nba_regular_season_player_stats', '(GAME_ID)'),
+    ('nba_regular_season_player_stats_game_date_idx', 'nba_regular_season_player_stats', '(GAME_DATE)'),
+    ('nba_advanced_player_stats_game_idx', 'nba_advanced_player_stats', '(GAME_ID)'),
+    ('nba_advanced_team_stats_game_idx', 'nba_advanced_team_stats', '(GAME_ID)'),
+    # per-player and per-team lookups the ratings and features group by, answered from the index alone
+    ('nba_regular_season_player_stats_player_idx', 'nba_regular_season_player_stats',
+     '(PLAYER_ID, TEAM_ABBREVIATION, GAME_DATE) INCLUDE (GAME_ID)'),
+    ('nba_advanced_player_stats_player_idx', 'nba_advanced_player_stats',
+     '(PLAYER_ID, TEAM_ABBREVIATION) INCLUDE (GAME_ID)'),
+    ('nba_advanced_team_stats_team_idx', 'nba_advanced_team_stats', '(TEAM_ABBREVIATION) INCLUDE (GAME_ID)'),
+]
+
+
+def partition_name(table, season):
+    if not re.fullmatch(r"\d{4}-\d{2}", season):
+        raise ValueError(f"Not a season like 2024-25: {season!r}")
+    return f"{table}_{season.replace('-', '_')}"
+
+
+def _create_season_partition(cur, table, season):
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {partition_name(table, season)} PARTITION OF {table} FOR VALUES IN (%s)",
+                (season,))
+
+
+def _create_tables(cur):
+    for table, columns in table_columns.items():
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} ({columns},
+                CONSTRAINT {table}_unique UNIQUE ({', '.join(unpartitioned_keys[table])})
+            )
+        """)
+        ensure_season_column(cur, table)
+
+
+def _partition_stats_tables(cur):
+    # the player values view reads these tables, so it has to go; its next refresh creates it again
+    cur.execute(f"DROP MATERIALIZED VIEW IF EXISTS {config.PLAYER_VALUES_VIEW}")
+
+    for table, keys in season_partitioned_keys.items():
+        unpartitioned = f"{table}_unpartitioned"
+        cur.execute(f"ALTER TABLE {table} RENAME TO {unpartitioned}")
+        cur.execute(f"ALTER TABLE {unpartitioned} RENAME CONSTRAINT {table}_unique TO {unpartitioned}_unique")
+
+        cur.execute(f"""
+            CREATE TABLE {table} ({table_columns[table]},
+                CONSTRAINT {table}_unique UNIQUE ({', '.join(keys)})
+            ) PARTITION BY LIST (SEASON_YEAR)
+        """)
+        # there is no default partition: SEASON_YEAR leads the unique key, so a row without a
+        # season could never conflict with its earlier copy and would be loaded again every run
+        cur.execute(f"SELECT DISTINCT SEASON_YEAR FROM {unpartitioned} WHERE SEASON_YEAR IS NOT NULL")
+        for (season,) in cur.fetchall():
+            _create_season_partition(cur, table, season)
+
+        cur.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = %s ORDER BY ordinal_position
+        """, (table,))
+        column_list = ", ".join(row[0] for row in cur.fetchall())
+        cur.execute(f"""
+            INSERT INTO {table} ({column_list})
+            SELECT {column_list} FROM {unpartitioned} WHERE SEASON_YEAR IS NOT NULL
+        """)
+        cur.execute(f"DROP TABLE {unpartitioned}")
+
+
+def _drop_default_partitions(cur):
+    # databases partitioned before rows without a season were rejected have a default partition
+    for table in season_partitioned_keys:
+        cur.execute("SELECT to_regclass(%s)", (f"{table}_default",))
+        if cur.fetchone()[0] is None:
+            continue
+        cur.execute(f"SELECT COUNT(*) FROM {table}_default")
+        print(f"Dropping {table}_default with {cur.fetchone()[0]} rows without a season")
+        cur.execute(f"DROP TABLE {table}_default")
+
+
+def _create_query_indexes(cur):
+    for name, table, definition in query_indexes:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} {definition}")
+
+
+migrations = [
+    (1, "create the loader tables, adding SEASON_YEAR to ones created before it", _create_tables),
+    (2, "partition the player and advanced stats tables by SEASON_YEAR", _partition_stats_tables),
+    (3, "index game ids, game dates and the per-player and per-team lookups", _create_query_indexes),
+    (4, "drop the default partitions that held rows without a season", _drop_default_partitions),
+]
+
+
+def _lock_schema(cur):
+    # held until commit, so backfill workers starting together don't race each other's DDL
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (schema_lock_id,))
+
+
+def _schema_version(cur):
+    cur.execute("SELECT to_regclass('schema_migrations')")
+    if cur.fetchone()[0] is None:
+        return 0
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return cur.fetchone()[0]
+
+
+def migrate(conn_id=config.POSTGRES_CONN_ID):
+    """Apply the migrations this database hasn't had yet, in one transaction; returns the versions applied"""
+    conn = get_conn(conn_id)
+    cur = conn.cursor()
+
+    applied = []
+    if _schema_version(cur) < migrations[-1][0]:
+        _lock_schema(cur)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                description VARCHAR(200),
+                applied_at TIMESTAMP DEFAULT now()
+            )
+        """)
+        current_version = _schema_version(cur)
+        for version, description, apply in migrations:
+            if version <= current_version:
+                continue
+            print(f"Applying migration {version}: {description}")
+            apply(cur)
+            cur.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)", (version, description))
+            applied.append(version)
+
+    conn.commit()
+    cur.close()
+    conn.close()
+    return applied
+
+
+def ensure_season_partitions(table, seasons, conn_id=config.POSTGRES_CONN_ID):
+    """Create the partitions `table` needs for `seasons`.
+
+    They are created and committed on their own connection. The load that follows then
+    holds no lock on the parent table, so loads into other seasons aren't blocked.
+    """
+    conn = get_conn(conn_id)
+    cur = conn.cursor()
+
+    missing = []
+    for season in {str(season) for season in seasons}:
+        cur.execute("SELECT to_regclass(%s)", (partition_name(table, season),))
+        if cur.fetchone()[0] is None:
+            missing.append(season)
+
+    if missing:
+        _lock_schema(cur)
+        for season in sorted(missing):
+            _create_season_partition(cur, table, season)
+        print(f"Created {table} partitions for {', '.join(sorted(missing))}")
+
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    applied = migrate()
+    print(f"Applied migrations {applied}" if applied else "Schema is up to date")
@@ -0,0 +1,145 @@
+import difflib
+import re
+import unicodedata
+from collections import defaultdict
+import pandas as pd
+import config
+from bulk_load import copy_upsert
+
+
+crosswalk_columns = ['spotrac_name', 'team_abbreviation', 'player_id', 'nba_player_name', 'match_method', 'match_score']
+
+block_prefix_length = 3
+
+
+def normalize_player_name(name):
+    name = unicodedata.normalize('NFD', name)
+    name = ''.join(c for c in name if unicodedata.category(c) != 'Mn')
+
+    name = re.sub(r'\b(Jr\.?|Sr\.?|III|II|IV)\b', '', name)
+
+    name = re.sub(r'\s+', ' ', name)
+
+    return name.strip().lower()
+
+
+def block_keys(team, clean_name):
+    """Blocks a name is compared within: same team and same first letters of the last name, or of the first name"""
+    parts = clean_name.split()
+    if not parts:
+        return []
+    return [
+        (team, 'last', parts[-1][:block_prefix_length]),
+        (team, 'first', parts[0][:block_prefix_length]),
+    ]
+
+
+def match_players(names, players, threshold=config.CROSSWALK_MATCH_THRESHOLD):
+    """Resolve Spotrac (spotrac_name, team_abbreviation) rows to NBA player ids.
+
+    An exact match on the normalized name wins. Anything else is scored with difflib only
+    against the players sharing one of its blocks, instead of against every player in the
+    league, and is left unresolved below `threshold`.
+    """
+    by_name = defaultdict(list)
+    blocks = defaultdict(list)
+    for player_id, player_name, team in players[['player_id', 'player_name', 'team_abbreviation']].drop_duplicates().itertuples(index=False):
+        clean_name = normalize_player_name(player_name)
+        by_name[clean_name].append((player_id, player_name, team))
+        for key in block_keys(team, clean_name):
+            blocks[key].append((player_id, player_name, clean_name))
+
+    matches = []
+    for spotrac_name, team in names[['spotrac_name', 'team_abbreviation']].itertuples(index=False):
+        clean_name = normalize_player_name(spotrac_name)
+
+        exact = by_name.get(clean_name)
+        if exact:
+            # two players sharing a name are told apart by the team
+            on_team = [player for player in exact if player[2] == team]
+            player_id, player_name, _ = (on_team or exact)[0]
+            matches.append((spotrac_name, team, player_id, player_name, 'exact', 1.0))
+            continue
+
+        best, best_score = None, 0.0
+        for key in block_keys(team, clean_name):
+            for player_id, player_name, candidate_name in blocks.get(key, []):
+                score = difflib.SequenceMatcher(None, clean_name, candidate_name).ratio()
+                if score > best_score:
+                    best, best_score = (player_id, player_name), score
+
+        if best is not None and best_score >= threshold:
+            matches.append((spotrac_name, team, best[0], best[1], 'fuzzy', best_score))
+        else:
+            matches.append((spotrac_name, team, None, None, 'unresolved', best_score or None))
+
+    return pd.DataFrame(matches, columns=crosswalk_columns)
+
+
+def ensure_player_crosswalk_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS player_crosswalk (
+            spotrac_name VARCHAR(100),
+            team_abbreviation VARCHAR(10),
+            player_id INT,
+            nba_player_name VARCHAR(100),
+            match_method VARCHAR(20),
+            match_score DOUBLE PRECISION,
+            PRIMARY KEY (spotrac_name, team_abbreviation)
+        )
+    """)
+
+    # the crosswalk used to be keyed on the Spotrac name alone, so two players sharing a name
+    # collided; re-key it on name and team, dropping the rows that never had a team
+    cur.execute("""
+        SELECT COUNT(*) FROM information_schema.key_column_usage
+        WHERE table_name = 'player_crosswalk' AND constraint_name = 'player_crosswalk_pkey'
+    """)
+    if cur.fetchone()[0] == 1:
+        cur.execute("DELETE FROM player_crosswalk WHERE team_abbreviation IS NULL")
+        cur.execute("""
+            ALTER TABLE player_crosswalk
+                DROP CONSTRAINT player_crosswalk_pkey,
+                ADD PRIMARY KEY (spotrac_name, team_abbreviation)
+        """)
+        print("Re-keyed player_crosswalk on (spotrac_name, team_abbreviation)")
+
+
+def update_player_crosswalk(cur, salaries, players):
+    """Match the Spotrac (Player, team_abbreviation) rows the crosswalk hasn't resolved yet against `players`.
+
+    Resolved rows are kept as they are, so a wrong match can be fixed by hand in player_crosswalk
+    and stays fixed. Unresolved names are stored too and retried on the next run.
+    """
+    ensure_player_crosswalk_table(cur)
+
+    cur.execute("SELECT spotrac_name, team_abbreviation FROM player_crosswalk WHERE player_id IS NOT NULL")
+    resolved = set(cur.fetchall())
+
+    # a name is only looked up together with its team, so rows whose team isn't known are skipped
+    pending = (
+        salaries[['Player', 'team_abbreviation']]
+        .rename(columns={'Player': 'spotrac_name'})
+        .dropna(subset=['team_abbreviation'])
+        .drop_duplicates(subset=['spotrac_name', 'team_abbreviation'])
+    )
+    pending = pending[[key not in resolved for key in pending.itertuples(index=False, name=None)]]
+    if pending.empty:
+        return pending
+
+    matches = match_players(pending, players)
+    copy_upsert(
+        cur, matches, 'player_crosswalk',
+        columns=crosswalk_columns,
+        conflict_columns=['spotrac_name', 'team_abbreviation'],
+        update_columns=[column for column in crosswalk_columns if column not in ('spotrac_name', 'team_abbreviation')],
+    )
+
+    counts = matches['match_method'].value_counts()
+    print(f"Player crosswalk: {len(matches)} new names, {counts.get('exact', 0)} exact, "
+          f"{counts.get('fuzzy', 0)} fuzzy, {counts.get('unresolved', 0)} unresolved")
+    unresolved = matches.loc[matches['match_method'] == 'unresolved', 'spotrac_name']
+    if not unresolved.empty:
+        print(f"Unresolved Spotrac names: {', '.join(unresolved)}")
+
+    return matches
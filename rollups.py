@@ -0,0 +1,105 @@
+import hashlib
+import config
+from db import get_conn
+from instrumentation import instrumented
+
+
+def player_rollup_sql():
+    """One row per player, team and season: game-level values summed up, next to the player's features"""
+    return f"""
+        WITH games AS (
+            SELECT season_year, player_id, team AS team_abbreviation, MAX(player_name) AS player_name,
+                COUNT(*) AS games,
+                SUM(minutes) AS minutes,
+                SUM(player_game_value) AS value_total,
+                AVG(player_game_value) AS value_avg
+            FROM {config.PLAYER_VALUES_SOURCE}
+            GROUP BY season_year, player_id, team
+        ),
+        features AS (
+            -- two Spotrac rows can resolve to one player; the bigger contract wins
+            SELECT DISTINCT ON (season_year, player_id, team_abbreviation)
+                season_year, player_id, team_abbreviation, "Pos", salary, value_per_dollar, value_pct_in_team
+            FROM player_features
+            ORDER BY season_year, player_id, team_abbreviation, salary DESC NULLS LAST
+        )
+        SELECT g.*, f."Pos", f.salary, f.value_per_dollar, f.value_pct_in_team
+        FROM games g
+        LEFT JOIN features f USING (season_year, player_id, team_abbreviation)
+    """
+
+
+def team_rollup_sql():
+    return """
+        SELECT season_year, team_abbreviation, "Team",
+            COUNT(*) AS players,
+            SUM(salary) AS salary_total,
+            SUM(value_avg) AS value_avg_total,
+            SUM(value_per_dollar) AS value_per_dollar_total,
+            SUM(value_pct_in_team) AS value_pct_in_team_total
+        FROM player_features
+        GROUP BY season_year, team_abbreviation, "Team"
+    """
+
+
+def position_rollup_sql():
+    return """
+        SELECT season_year, "Pos",
+            COUNT(*) AS players,
+            SUM(salary) AS salary_total,
+            SUM(value_avg) AS value_avg_total,
+            SUM(value_per_dollar) AS value_per_dollar_total,
+            SUM(value_pct_in_team) AS value_pct_in_team_total
+        FROM player_features
+        GROUP BY season_year, "Pos"
+    """
+
+
+# view name -> (query, the columns of the unique index REFRESH ... CONCURRENTLY needs)
+rollup_views = {
+    'player_value_rollup': (player_rollup_sql, 'season_year, player_id, team_abbreviation'),
+    'team_value_rollup': (team_rollup_sql, 'season_year, team_abbreviation, "Team"'),
+    'position_value_rollup': (position_rollup_sql, 'season_year, "Pos"'),
+}
+
+
+@instrumented('refresh_rollups')
+def refresh_rollups(rebuild=False, conn_id=config.POSTGRES_CONN_ID):
+    """Create or refresh the per-player, per-team and per-position rollups the dashboards read.
+
+    An existing rollup is refreshed CONCURRENTLY, so dashboards keep reading the old rows
+    until the new ones are ready. Each view's comment holds a hash of the query it was created
+    with; one whose query has changed since, e.g. after PLAYER_VALUES_SOURCE was switched, is
+    created again. Pass rebuild=True to recreate them all.
+    """
+    conn = get_conn(conn_id)
+    cur = conn.cursor()
+
+    for view, (query, unique_columns) in rollup_views.items():
+        sql = query()
+        query_hash = hashlib.md5(sql.encode()).hexdigest()
+
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL, obj_description(to_regclass(%s), 'pg_class')", (view, view))
+        exists, created_with = cur.fetchone()
+        if exists and (rebuild or created_with != query_hash):
+            if not rebuild:
+                print(f"Rebuilding {view}, its query changed since it was created")
+            cur.execute(f"DROP MATERIALIZED VIEW {view}")
+            exists = False
+
+        if exists:
+            cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}")
+        else:
+            cur.execute(f"CREATE MATERIALIZED VIEW {view} AS {sql}")
+            cur.execute(f"CREATE UNIQUE INDEX {view}_unique ON {view} ({unique_columns})")
+            cur.execute(f"COMMENT ON MATERIALIZED VIEW {view} IS %s", (query_hash,))
+        # each refresh is its own transaction, so a dashboard never waits on all three
+        conn.commit()
+
+    cur.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    refresh_rollups()
+    print("Rollups refreshed")
@@ -1,150 +1,135 @@
 import requests
-from bs4 import BeautifulSoup
 import pandas as pd
-import requests
+import threading
 import time
 import random
-import re
-from sqlalchemy import create_engine
-from airflow.providers.postgres.hooks.postgres import PostgresHook
+from collections import defaultdict
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from sqlalchemy import inspect, text
+from urllib3.util.retry import Retry
+from db import get_engine
+from handoff import read_frame, write_frame
+from instrumentation import count, instrumented, record_rows, stage, timed
+import config
+from fetch_engine import iter_fetch
+from salary_parser import numeric_columns, parse_team_salary_html
+from seasons import season_from_start_year
 
 
-def clean_player_name(name):
-    if '\n' in name:
-        return name.split('\n')[-1].strip()
-    
-    cleaned = re.sub(r'^\d+\s+', '', name)
-    return cleaned.strip()
+headers = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+# caps how many requests run against one host at a time, shared by every scraping thread
+host_limits = defaultdict(lambda: threading.BoundedSemaphore(config.SPOTRAC_MAX_CONCURRENCY_PER_HOST))
+
+
+teams = [
+    {"name": "Atlanta Hawks", "id": "atlanta-hawks"},
+    {"name": "Boston Celtics", "id": "boston-celtics"},
+    {"name": "Brooklyn Nets", "id": "brooklyn-nets"},
+    {"name": "Charlotte Hornets", "id": "charlotte-hornets"},
+    {"name": "Chicago Bulls", "id": "chicago-bulls"},
+    {"name": "Cleveland Cavaliers", "id": "cleveland-cavaliers"},
+    {"name": "Dallas Mavericks", "id": "dallas-mavericks"},
+    {"name": "Denver Nuggets", "id": "denver-nuggets"},
+    {"name": "Detroit Pistons", "id": "detroit-pistons"},
+    {"name": "Golden State Warriors", "id": "golden-state-warriors"},
+    {"name": "Houston Rockets", "id": "houston-rockets"},
+    {"name": "Indiana Pacers", "id": "indiana-pacers"},
+    {"name": "Los Angeles Clippers", "id": "la-clippers"},
+    {"name": "Los Angeles Lakers", "id": "los-angeles-lakers"},
+    {"name": "Memphis Grizzlies", "id": "memphis-grizzlies"},
+    {"name": "Miami Heat", "id": "miami-heat"},
+    {"name": "Milwaukee Bucks", "id": "milwaukee-bucks"},
+    {"name": "Minnesota Timberwolves", "id": "minnesota-timberwolves"},
+    {"name": "New Orleans Pelicans", "id": "new-orleans-pelicans"},
+    {"name": "New York Knicks", "id": "new-york-knicks"},
+    {"name": "Oklahoma City Thunder", "id": "oklahoma-city-thunder"},
+    {"name": "Orlando Magic", "id": "orlando-magic"},
+    {"name": "Philadelphia 76ers", "id": "philadelphia-76ers"},
+    {"name": "Phoenix Suns", "id": "phoenix-suns"},
+    {"name": "Portland Trail Blazers", "id": "portland-trail-blazers"},
+    {"name": "Sacramento Kings", "id": "sacramento-kings"},
+    {"name": "San Antonio Spurs", "id": "san-antonio-spurs"},
+    {"name": "Toronto Raptors", "id": "toronto-raptors"},
+    {"name": "Utah Jazz", "id": "utah-jazz"},
+    {"name": "Washington Wizards", "id": "washington-wizards"}
+]
+
+
+def make_session():
+    """One HTTP session for the whole scrape, retrying connection errors and 429/5xx responses with backoff"""
+    retry = Retry(
+        total=config.SPOTRAC_RETRIES,
+        backoff_factor=config.SPOTRAC_BACKOFF,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_maxsize=config.SPOTRAC_MAX_CONCURRENCY_PER_HOST)
 
-def get_team_salary_data(team_id, team_name, year=2024):
+    session = requests.Session()
+    session.headers.update(headers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def polite_get(session, url, timeout=config.SPOTRAC_TIMEOUT):
+    with host_limits[urlparse(url).netloc]:
+        time.sleep(random.uniform(0, config.SPOTRAC_MAX_JITTER))
+        response = session.get(url, timeout=timeout)
+    response.raise_for_status()
+    return response
+
+
+def get_team_salary_data(team_id, team_name, year=2024, session=None, timeout=config.SPOTRAC_TIMEOUT):
     """Get salary data for a specific team"""
     url = f"https://www.spotrac.com/nba/{team_id}/overview/_/year/{year}"
     
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
-    
     print(f"Fetching data from: {url}")
     
+    if session is None:
+        session = make_session()
+    response = polite_get(session, url, timeout=timeout)
 
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-        
-    soup = BeautifulSoup(response.text, 'html.parser')
-        
-    tables = soup.find_all('table')
-        
-    salary_table = None
-    for i, table in enumerate(tables):
-            headers = [th.text.strip() for th in table.find_all('th') if th.text.strip()]
-            if headers and 'Player' in headers[0]:
-                print(f"Table {i} has headers: {headers}")
-                salary_table = table
-                break
-        
-    headers = []
-    for th in salary_table.find_all('th'):
-            header_text = th.text.strip()
-            header_text = header_text.replace('\n', ' ')
-            
-            if header_text.startswith('Player'):
-                header_text = 'Player'
-                
-            headers.append(header_text)
-        
-    print(f"Selected table with headers: {headers}")
-        
-    rows = salary_table.find_all('tr')
-        
-    if rows and any(th.name == 'th' for th in rows[0].find_all(['th', 'td'])):
-            rows = rows[1:]
-        
-    salary_data = []
-        
-    for row in rows:
-            cols = row.find_all('td')
-            
-            if len(cols) < 3: 
-                continue
-            
-            row_data = {'Team': team_name} 
-            
-            for i, col in enumerate(cols):
-                if i < len(headers):
-                    header = headers[i]
-                    value = col.text.strip()
-                    
-                    if header == 'Player':
-                        value = clean_player_name(value)
-                    
-                    if '$' in value:
-                        value = re.sub(r'[$,]', '', value)
-                    
-                    if '%' in value:
-                        value = value.replace('%', '')
-                    
-                    row_data[header] = value
-            
-            salary_data.append(row_data)
-        
-    df = pd.DataFrame(salary_data)
-        
-    for col in df.columns:
-            if any(keyword in col.lower() for keyword in ['cap', 'salary', 'cash', 'hit', 'pct']):
-                try:
-                    df[col] = pd.to_numeric(df[col], errors='ignore')
-                except:
-                    pass  
-        
-    return df
+    with timed('parse_salary_page'):
+        return parse_team_salary_html(response.text, team_name)
     
 
-def main():
-    year = 2024
-    
-    teams = [
-        {"name": "Atlanta Hawks", "id": "atlanta-hawks"},
-        {"name": "Boston Celtics", "id": "boston-celtics"},
-        {"name": "Brooklyn Nets", "id": "brooklyn-nets"},
-        {"name": "Charlotte Hornets", "id": "charlotte-hornets"},
-        {"name": "Chicago Bulls", "id": "chicago-bulls"},
-        {"name": "Cleveland Cavaliers", "id": "cleveland-cavaliers"},
-        {"name": "Dallas Mavericks", "id": "dallas-mavericks"},
-        {"name": "Denver Nuggets", "id": "denver-nuggets"},
-        {"name": "Detroit Pistons", "id": "detroit-pistons"},
-        {"name": "Golden State Warriors", "id": "golden-state-warriors"},
-        {"name": "Houston Rockets", "id": "houston-rockets"},
-        {"name": "Indiana Pacers", "id": "indiana-pacers"},
-        {"name": "Los Angeles Clippers", "id": "la-clippers"},
-        {"name": "Los Angeles Lakers", "id": "los-angeles-lakers"},
-        {"name": "Memphis Grizzlies", "id": "memphis-grizzlies"},
-        {"name": "Miami Heat", "id": "miami-heat"},
-        {"name": "Milwaukee Bucks", "id": "milwaukee-bucks"},
-        {"name": "Minnesota Timberwolves", "id": "minnesota-timberwolves"},
-        {"name": "New Orleans Pelicans", "id": "new-orleans-pelicans"},
-        {"name": "New York Knicks", "id": "new-york-knicks"},
-        {"name": "Oklahoma City Thunder", "id": "oklahoma-city-thunder"},
-        {"name": "Orlando Magic", "id": "orlando-magic"},
-        {"name": "Philadelphia 76ers", "id": "philadelphia-76ers"},
-        {"name": "Phoenix Suns", "id": "phoenix-suns"},
-        {"name": "Portland Trail Blazers", "id": "portland-trail-blazers"},
-        {"name": "Sacramento Kings", "id": "sacramento-kings"},
-        {"name": "San Antonio Spurs", "id": "san-antonio-spurs"},
-        {"name": "Toronto Raptors", "id": "toronto-raptors"},
-        {"name": "Utah Jazz", "id": "utah-jazz"},
-        {"name": "Washington Wizards", "id": "washington-wizards"}
-    ]
-    
+@instrumented('scrape_salaries')
+def main(year=2024):
     print(f"Starting to scrape data for {len(teams)} NBA teams")
     
     all_teams_data = []
     successful_teams = 0
-    
-    for i, team in enumerate(teams):
-        print(f"\nProcessing {i+1}/{len(teams)}: {team['name']}")
-        
-        team_data = get_team_salary_data(team['id'], team['name'], year)
-        
+    failed_teams = []
+
+    session = make_session()
+
+    def fetch_team(team, timeout):
+        return get_team_salary_data(team['id'], team['name'], year, session=session, timeout=timeout)
+
+    # HTTP retries happen in the session, so the engine itself doesn't retry; a team that
+    # still fails comes back as its exception and the rest of the batch carries on
+    team_results = iter_fetch(
+        teams, fetch_team,
+        rate=config.SPOTRAC_REQUESTS_PER_SECOND,
+        burst=config.SPOTRAC_MAX_CONCURRENCY_PER_HOST,
+        max_workers=config.SPOTRAC_MAX_CONCURRENCY_PER_HOST,
+        timeout=config.SPOTRAC_TIMEOUT,
+        retries=0,
+        return_exceptions=True,
+    )
+
+    for team, team_data in zip(teams, team_results):
+        if isinstance(team_data, Exception):
+            failed_teams.append(team['name'])
+            count('salary_pages_failed')
+            print(f"Failed to scrape {team['name']}: {team_data!r}")
+            continue
+
         if team_data is not None and not team_data.empty:
             columns_to_keep = ['Team', 'Player', 'Pos', 'Age', 'Cap Hit', 'Cap Hit Pct League Cap', 
                               'Apron Salary', 'Luxury Tax', 'Cash Total', 'Cash Guaranteed', 'Free Agent Year']
@@ -158,37 +143,64 @@ def main():
             
         else:
             print(f"No data found for {team['name']}")
-        
-        if i < len(teams) - 1:  
-            delay = random.uniform(2, 4)  
-            print(f"Waiting {delay:.2f} seconds before next request...")
-            time.sleep(delay)
+
+    session.close()
     
     print(f"\nCompleted scraping {successful_teams} out of {len(teams)} teams")
+    if failed_teams:
+        print(f"Failed teams: {', '.join(failed_teams)}")
     
     if all_teams_data:
         combined_df = pd.concat(all_teams_data, ignore_index=True)
+        combined_df['season_year'] = season_from_start_year(year)
         
-        csv_filename = f"nba_team_salaries_{year}.csv"
-        combined_df.to_csv(csv_filename, index=False)
-        print(f"\nCombined data saved to {csv_filename}")
+        write_frame(combined_df, f"nba_team_salaries_{year}")
         
         print(f"\nCombined data: {len(combined_df)} players across {successful_teams} teams")
         print("\nFirst few rows:")
         print(combined_df.head())
 
+        return combined_df
 
-def upload_to_postgresql(file_path, table_name):
-    df = pd.read_csv(file_path)
 
-    pg_hook = PostgresHook(postgres_conn_id='postgres_nba_financial')
-    
-    engine = create_engine(pg_hook.get_uri())
-    
-    df.to_sql(table_name, engine, if_exists='replace', index=False)
-    print(f"Successfully uploaded data to PostgreSQL table: {table_name}")
+def _has_season_column(engine, table_name):
+    inspector = inspect(engine)
+    if not inspector.has_table(table_name):
+        return False
+    return 'season_year' in {column['name'] for column in inspector.get_columns(table_name)}
+
 
-    engine.dispose()
+def _retype_text_columns(connection, table_name, df):
+    # tables uploaded while the handoff kept Age and Free Agent Year as strings hold them as TEXT
+    columns = {column['name']: column['type'] for column in inspect(connection).get_columns(table_name)}
+    for column in numeric_columns:
+        if (column in df.columns and pd.api.types.is_integer_dtype(df[column])
+                and column in columns and columns[column].python_type is str):
+            connection.execute(text(
+                f'ALTER TABLE {table_name} ALTER COLUMN "{column}" TYPE BIGINT USING NULLIF("{column}", \'\')::bigint'
+            ))
+            print(f"Converted {table_name}.{column} to BIGINT")
+
+
+def upload_to_postgresql(source, table_name):
+    """Replace the uploaded seasons' rows, keeping the other seasons; a table without season_year is replaced whole"""
+    with stage(f'upload_{table_name}'):
+        df = read_frame(source)
+
+        engine = get_engine()
+
+        if 'season_year' in df.columns and _has_season_column(engine, table_name):
+            with engine.begin() as connection:
+                _retype_text_columns(connection, table_name, df)
+                connection.execute(
+                    text(f"DELETE FROM {table_name} WHERE season_year = ANY(:seasons)"),
+                    {'seasons': df['season_year'].unique().tolist()},
+                )
+                df.to_sql(table_name, connection, if_exists='append', index=False)
+        else:
+            df.to_sql(table_name, engine, if_exists='replace', index=False)
+        record_rows(len(df))
+    print(f"Successfully uploaded data to PostgreSQL table: {table_name}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,93 @@
+import re
+import pandas as pd
+from lxml import html as lxml_html
+
+
+numeric_keywords = ['cap', 'salary', 'cash', 'hit', 'pct']
+# whole-number columns that read_csv used to type when the table went through a CSV
+numeric_columns = ['Age', 'Free Agent Year']
+
+
+def clean_player_name(name):
+    if '\n' in name:
+        return name.split('\n')[-1].strip()
+
+    cleaned = re.sub(r'^\d+\s+', '', name)
+    return cleaned.strip()
+
+
+def find_salary_table(document):
+    """Return the first <table> whose first non-empty header cell mentions 'Player'"""
+    for table in document.iter('table'):
+        for th in table.iter('th'):
+            header_text = th.text_content().strip()
+            if header_text:
+                if 'Player' in header_text:
+                    return table
+                break
+    return None
+
+
+def parse_team_salary_html(page_html, team_name):
+    """Parse a Spotrac team overview page into one row per player, using lxml's C parser"""
+    document = lxml_html.fromstring(page_html)
+    salary_table = find_salary_table(document)
+    if salary_table is None:
+        raise ValueError(f"No player salary table found for {team_name}")
+
+    headers = []
+    for th in salary_table.iter('th'):
+        header_text = th.text_content().strip().replace('\n', ' ')
+        if header_text.startswith('Player'):
+            header_text = 'Player'
+        headers.append(header_text)
+
+    rows = list(salary_table.iter('tr'))
+    if rows and any(cell.tag == 'th' for cell in rows[0].iter('th', 'td')):
+        rows = rows[1:]
+
+    cell_rows = []
+    for row in rows:
+        cells = [td.text_content().strip() for td in row.iter('td')]
+        if len(cells) >= 3:
+            cell_rows.append(cells[:len(headers)])
+
+    # a header that repeats keeps its first position and its last non-missing cell, like filling a dict per row
+    positions = {}
+    for i, header in enumerate(headers):
+        positions.setdefault(header, []).append(i)
+
+    columns = {'Team': [team_name] * len(cell_rows)}
+    for header, indexes in positions.items():
+        if not any(indexes[0] < len(cells) for cells in cell_rows):
+            continue
+        columns[header] = [
+            next((cells[i] for i in reversed(indexes) if i < len(cells)), None)
+            for cells in cell_rows
+        ]
+
+    df = pd.DataFrame(columns)
+    if df.empty:
+        return df
+
+    for col in df.columns:
+        if col == 'Team':
+            continue
+
+        values = df[col]
+        if col == 'Player':
+            values = values.map(clean_player_name, na_action='ignore')
+
+        has_dollar = values.str.contains('$', regex=False, na=False)
+        values = values.mask(has_dollar, values.str.replace(r'[$,]', '', regex=True))
+        values = values.str.replace('%', '', regex=False)
+        df[col] = values
+
+    for col in df.columns:
+        if col in numeric_columns or any(keyword in col.lower() for keyword in numeric_keywords):
+            try:
+                df[col] = pd.to_numeric(df[col])
+            except (ValueError, TypeError):
+                pass
+
+    return df
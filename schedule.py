@@ -0,0 +1,82 @@
+import os
+import pickle
+import threading
+import time
+from nba_api.stats.endpoints import leaguegamefinder
+import config
+from instrumentation import count, timed
+from seasons import season_window
+
+nba_teams = [
+    "ATL", "BKN", "BOS", "CHA", "CHI", "CLE", "DAL", "DEN", "DET",
+    "GSW", "HOU", "IND", "LAC", "LAL", "MEM", "MIA", "MIL", "MIN",
+    "NOP", "NYK", "OKC", "ORL", "PHI", "PHX", "POR", "SAC", "SAS",
+    "TOR", "UTA", "WAS"
+]
+
+# season -> (fetched_at, games), so stages in the same process share one schedule
+_schedules = {}
+_schedules_lock = threading.Lock()
+
+
+def schedule_cache_file(season=config.SEASON):
+    return os.path.join(config.SCHEDULE_CACHE_DIR, f"schedule_{season}.pkl")
+
+
+def _read_cached_schedule(season, ttl):
+    path = schedule_cache_file(season)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        fetched_at, games = pickle.load(f)
+    if time.time() - fetched_at > ttl:
+        return None
+    return fetched_at, games
+
+
+def _write_cached_schedule(season, fetched_at, games):
+    os.makedirs(config.SCHEDULE_CACHE_DIR, exist_ok=True)
+    path = schedule_cache_file(season)
+    # written aside and swapped in, so a backfill worker never reads a half-written file
+    partial_path = f"{path}.{os.getpid()}.partial"
+    with open(partial_path, "wb") as f:
+        pickle.dump((fetched_at, games), f)
+    os.replace(partial_path, path)
+
+
+def _fetch_schedule(season):
+    start_date, end_date = season_window(season)
+
+    count('api_requests')
+    with timed('api_call'):
+        gamefinder = leaguegamefinder.LeagueGameFinder(season_nullable=season)
+    games = gamefinder.get_data_frames()[0]
+
+    nba_games = games[games['TEAM_ABBREVIATION'].isin(nba_teams)]
+    return nba_games[(nba_games['GAME_DATE'] > start_date) & (nba_games['GAME_DATE'] < end_date)]
+
+
+def season_schedule(season=config.SEASON, ttl=config.SCHEDULE_CACHE_TTL):
+    """The season's regular-season LeagueGameFinder rows (one per team and game), fetched at most once per `ttl` seconds.
+
+    The frame is kept in memory for the rest of the process and on disk under
+    SCHEDULE_CACHE_DIR for later runs. It is shared between callers, so treat it as read-only.
+    """
+    with _schedules_lock:
+        cached = _schedules.get(season)
+        if cached is None or time.time() - cached[0] > ttl:
+            cached = _read_cached_schedule(season, ttl)
+
+        if cached is None:
+            count('schedule_cache_misses')
+            cached = (time.time(), _fetch_schedule(season))
+            _write_cached_schedule(season, *cached)
+        else:
+            count('schedule_cache_hits')
+
+        _schedules[season] = cached
+        return cached[1]
+
+
+def regular_season_game_ids(season=config.SEASON, ttl=config.SCHEDULE_CACHE_TTL):
+    return season_schedule(season, ttl)['GAME_ID'].unique().tolist()
@@ -0,0 +1,65 @@
+import config
+
+
+# Regular-season dates per season, exclusive on both ends the way the fetchers filter GAME_DATE
+regular_season_windows = {
+    "2019-20": ("2019-10-21", "2020-08-15"),
+    "2020-21": ("2020-12-21", "2021-05-17"),
+    "2021-22": ("2021-10-18", "2022-04-11"),
+    "2022-23": ("2022-10-17", "2023-04-10"),
+    "2023-24": ("2023-10-23", "2024-04-15"),
+    "2024-25": ("2024-10-22", "2025-04-14"),
+}
+
+
+def season_window(season=config.SEASON):
+    if season not in regular_season_windows:
+        raise ValueError(f"No regular-season dates for {season}; pass them as {season}:START:END")
+    return regular_season_windows[season]
+
+
+def parse_season(spec):
+    """Read a season given as '2023-24' or '2023-24:2023-10-23:2024-04-15', registering the dates if given"""
+    season, _, window = spec.partition(':')
+    if window:
+        start_date, end_date = window.split(':')
+        regular_season_windows[season] = (start_date, end_date)
+    season_window(season)
+    return season
+
+
+def season_start_year(season=config.SEASON):
+    return int(season[:4])
+
+
+def season_from_start_year(year):
+    return f"{year}-{(year + 1) % 100:02d}"
+
+
+def game_in_season(game_id, season):
+    """GAME_IDs carry the season in their 4th and 5th digits, e.g. 0022400001 is a 2024-25 game"""
+    return game_id[3:5] == season[2:4]
+
+
+def season_from_game_id_sql(column):
+    return (f"'20' || substr({column}, 4, 2) || '-' || "
+            f"lpad(((substr({column}, 4, 2)::int + 1) % 100)::text, 2, '0')")
+
+
+def ensure_season_column(cur, table, game_id_column='GAME_ID'):
+    """Add SEASON_YEAR to a table created before seasons were tracked, filling it in from the GAME_ID"""
+    cur.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = %s AND column_name = 'season_year'
+    """, (table,))
+    if cur.fetchone() is None:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN SEASON_YEAR VARCHAR(9)")
+        cur.execute(f"UPDATE {table} SET SEASON_YEAR = {season_from_game_id_sql(game_id_column)}")
+
+
+def drop_rows_without_season(frame, table):
+    """Rows of `frame` that have a SEASON_YEAR; the rest can't be placed in a partition of `table` and are dropped"""
+    missing = frame['SEASON_YEAR'].isna()
+    if missing.any():
+        print(f"Skipping {missing.sum()} rows without a SEASON_YEAR for {table}")
+    return frame[~missing]